@@ -0,0 +1,3 @@
+from time import perf_counter_ns
+
+T_LAUNCH = perf_counter_ns()  # to report the startup time (see PrettyWidget.presented)
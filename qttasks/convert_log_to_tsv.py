@@ -1,100 +1,207 @@
 #!/usr/bin/env python3
 
-from re import match
-from datetime import datetime
-from numpy import where, abs
-from pandas import DataFrame
+import re
+from json import load as load_json
+from numpy import abs, append, argsort, array, char, clip, concatenate, empty, fromfile, load, searchsorted, where, zeros
+from pandas import DataFrame, concat, read_csv
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from os.path import commonpath
 from pathlib import Path
 
+from .events import EVENT_DTYPE, EVENTS
+from .paths import LOG_DIR
 
-EPSILON = 0.010  # in ms
-
-
-def import_txt(log_txt):
-
-    df = {
-        'time': [],
-        'info': [],
-        }
 
+EPSILON = 0.010  # in ms
+LOG_PATTERN = 'log_????????_??????.txt'
+INDEX_TSV = 'index.tsv'
+CHUNK_SIZE = 2 ** 14  # lines with triggers or stimuli
+TRIGGER = 'Sending trigger '
+PRESENT = 'Presenting '
+LINE = re.compile(r"(\d{2}):(\d{2}):(\d{2}.\d{3})\tqttask\t\w*\t(.*)")
+
+
+def iter_txt(log_txt, chunk_size=CHUNK_SIZE):
+    """Read the triggers and the stimuli in the log, one chunk at the time.
+
+    Lines without TRIGGER or PRESENT are skipped without the regex, so the
+    rest of the log (f.e. dataglove) is read once, but neither parsed nor kept
+    in memory.
+
+    Yields
+    ------
+    ndarray
+        time of the lines, in s from midnight (at most chunk_size)
+    ndarray
+        info of the lines (at most chunk_size)
+    """
+    time = empty(chunk_size)
+    info = empty(chunk_size, dtype=object)
+    n = 0
     with open(log_txt) as f:
         for line in f:
-            g = match(r"(\d{2}:\d{2}:\d{2}.\d{3})\tqttask\t\w*\t(.*)", line)
-            if g and (g.group(2).startswith('Sending trigger ') or g.group(2).startswith('Presenting ')):
-                df['time'].append(datetime.strptime(g.group(1), '%H:%M:%S.%f'))
-                df['info'].append(g.group(2))
-
-    return DataFrame(df)
+            if TRIGGER not in line and PRESENT not in line:
+                continue
+            g = LINE.match(line)
+            if g is None or not g.group(4).startswith((TRIGGER, PRESENT)):
+                continue
+            time[n] = int(g.group(1)) * 3600 + int(g.group(2)) * 60 + float(g.group(3))
+            info[n] = g.group(4)
+            n += 1
+            if n == chunk_size:
+                yield time.copy(), info.copy()
+                n = 0
+
+    yield time[:n].copy(), info[:n].copy()
+
+
+def import_txt(log_txt, chunk_size=CHUNK_SIZE):
+    """Read the triggers and the stimuli in the log (time in s).
+
+    The chunks are concatenated, because the TSV has one row per trigger
+    anyway: memory grows with the number of triggers and stimuli, but not
+    with the other lines of the log.
+    """
+    chunks = list(iter_txt(log_txt, chunk_size))
+    return DataFrame({
+        'time': concatenate([x[0] for x in chunks]),
+        'info': concatenate([x[1] for x in chunks]),
+        })
+
+
+def import_events(events_file):
+    """Read the binary event log (see EventLog), with the same columns as
+    import_txt, but with the precision of perf_counter_ns"""
+    with events_file.with_suffix('.json').open() as f:
+        header = load_json(f)
+    trial_name = array(header['trial_name'], dtype=str)
+
+    events = fromfile(events_file, dtype=EVENT_DTYPE)
+    is_trigger = events['event'] == EVENTS['trigger']
+    is_present = events['event'] == EVENTS['present']
+    events = events[is_trigger | is_present]
+    is_trigger = events['event'] == EVENTS['trigger']
+
+    triggers = char.add(TRIGGER, char.zfill(events['trigger'].astype(str), 3))
+    presented = char.add(PRESENT, trial_name[events['trial']])
+    return DataFrame({
+        'time': events['time'] / 1e9,
+        'info': where(is_trigger, triggers, presented).astype(object),
+        })
 
 
 def reset_timing(df):
     i_trigger_start = where(df['info'] == 'Sending trigger 250')[0][0]
-    t = df['time'] - df['time'][i_trigger_start]
-    df['time'] = t.dt.total_seconds()
+    df['time'] -= df['time'][i_trigger_start]
     return df
 
+def read_frames(frames_file):
+    """Time of the frames where a new stimulus was presented, in s from
+    trigger 250 (see FrameTimer)"""
+    with load(frames_file) as frames:
+        t_swap = frames['t_swap'][frames['trial'] >= 0]
+        return (t_swap - frames['t_zero']) / 1e9
+
+
+def use_swap_times(df, t_swap):
+    """Use the time when the frame was swapped for each 'Presenting' line and
+    for the trigger that follows it, instead of the time of the log line"""
+    i_present = where(df['info'].str.startswith(PRESENT))[0]
+    if len(i_present) != len(t_swap):
+        print(f'{len(i_present)} stimuli in the log, but {len(t_swap)} in the frames')
+    n = min(len(i_present), len(t_swap))
+    i_present = i_present[:n]
+    t_swap = t_swap[:n]
+
+    time = df['time'].to_numpy(copy=True)
+    time[i_present] = t_swap
+
+    i_trigger = i_present + 1
+    in_log = i_trigger < len(df)
+    i_trigger = i_trigger[in_log]
+    t_swap = t_swap[in_log]
+    is_trigger = df['info'].str.startswith(TRIGGER).to_numpy()[i_trigger]
+    time[i_trigger[is_trigger]] = t_swap[is_trigger]
+
+    df['time'] = time
+    return df
+
+
 def split_database(df):
     """Split the database in triggers and events"""
-    i_trigger = df['info'].str.startswith('Sending trigger ')
-    i_present = df['info'].str.startswith('Presenting ')
+    i_trigger = df['info'].str.startswith(TRIGGER)
+    i_present = df['info'].str.startswith(PRESENT)
+    i_baseline = df['info'].isin((PRESENT + 'BASELINE', PRESENT))
     df_trg = df.loc[i_trigger]
-
-    df_events = df.loc[i_present]
-    idx_events = ~df_events['info'].isin(('Presenting BASELINE', 'Presenting '))
-    df_events = df_events[idx_events]
+    df_events = df.loc[i_present & ~i_baseline]
 
     return df_trg, df_events
 
 
 def create_tsv(df_trg):
-    out = {
-        'onset': [],
-        'duration': [],
-        'value': [],
-        }
-
-    needs_duration = False
-    for row in df_trg.itertuples():
-        trigger = row.info[16:]
-
-        if trigger == '000':
-            out['duration'].append(row.time - out['onset'][-1])
-            needs_duration = False
-
-        else:
-            if needs_duration:
-                out['duration'].append(0)
-
-            out['onset'].append(row.time)
-            out['value'].append(trigger)
-            needs_duration = True
-
-    if needs_duration:
-        out['duration'].append(0)
-
-    out = DataFrame(out)
+    """Each trigger (apart from 000) is an event. If it's followed by trigger
+    000 (baseline), the duration is the time until then, otherwise it's 0."""
+    trigger = df_trg['info'].str[16:].to_numpy()
+    time = df_trg['time'].to_numpy()
+
+    is_onset = trigger != '000'
+    next_is_baseline = append(trigger[1:] == '000', False)
+    duration = where(next_is_baseline, append(time[1:], 0) - time, 0)
+
+    out = DataFrame({
+        'onset': time[is_onset],
+        'duration': duration[is_onset],
+        'value': trigger[is_onset],
+        })
     out['trial_name'] = ''
     return out
 
 
 def assign_events_to_tsv(out, df_events):
-    for row in df_events.itertuples():
-
-        d = out.onset - row.time
-        idx = abs(d).idxmin()
-
-        if abs(out['onset'][idx] - row.time) <= EPSILON:
-            out.loc[idx, 'trial_name'] = row.info[11:]
-        else:
-            print(f'Could not find matching trigger for event at {row.time}')
+    """Give the name of the event to the closest trigger, if it's closer than
+    EPSILON. The onsets do not need to be sorted (with the swap times, a
+    trigger can be earlier than the one before)."""
+    onsets = out['onset'].to_numpy()
+    t_events = df_events['time'].to_numpy()
+    names = df_events['info'].str[11:].to_numpy()
+
+    if onsets.shape[0] == 0:
+        matched = zeros(t_events.shape[0], dtype=bool)
+    else:
+        order = argsort(onsets, kind='stable')
+        sorted_onsets = onsets[order]
+        i = searchsorted(sorted_onsets, t_events)
+        i_before = clip(i - 1, 0, onsets.shape[0] - 1)
+        i_after = clip(i, 0, onsets.shape[0] - 1)
+        closest = where(
+            abs(sorted_onsets[i_before] - t_events) <= abs(sorted_onsets[i_after] - t_events),
+            i_before, i_after)
+        closest = order[closest]
+        matched = abs(onsets[closest] - t_events) <= EPSILON
+
+        trial_name = out['trial_name'].to_numpy(copy=True)
+        trial_name[closest[matched]] = names[matched]
+        out['trial_name'] = trial_name
+
+    if not matched.all():
+        t_unmatched = ', '.join(f'{t:.3f}' for t in t_events[~matched])
+        print(f'Could not find matching trigger for {(~matched).sum()} events at {t_unmatched}')
 
     return out
 
 
 def convert_log_to_tsv(log_txt):
-    df = import_txt(log_txt)
+    events_file = _events_file(log_txt)
+    if events_file.exists():
+        df = import_events(events_file)
+    else:
+        df = import_txt(log_txt)
     df = reset_timing(df)
+    frames_file = _frames_file(log_txt)
+    if frames_file.exists():
+        df = use_swap_times(df, read_frames(frames_file))
     df_trg, df_events = split_database(df)
     out = create_tsv(df_trg)
     out = assign_events_to_tsv(out, df_events)
@@ -102,17 +209,144 @@ def convert_log_to_tsv(log_txt):
     return out
 
 
+def find_logs(inputs):
+    """Find the logs in the folders (LOG_PATTERN) or with a pattern (on
+    Windows, the shell does not expand the patterns)"""
+    logs = []
+    for x in inputs:
+        path = Path(x)
+        if path.is_dir():
+            logs.extend(sorted(path.glob(LOG_PATTERN)))
+        elif path.exists():
+            logs.append(path)
+        else:
+            logs.extend(sorted(Path(f) for f in glob(x)))
+
+    return list(dict.fromkeys(x.resolve() for x in logs))
+
+
+def is_up_to_date(log_txt):
+    """The TSV is more recent than the log (and the binary files with the
+    events and the frames)"""
+    out_tsv = log_txt.with_suffix('.tsv')
+    if not out_tsv.exists():
+        return False
+    t_tsv = out_tsv.stat().st_mtime_ns
+    inputs = (log_txt, _events_file(log_txt), _frames_file(log_txt))
+    return all(t_tsv >= x.stat().st_mtime_ns for x in inputs if x.exists())
+
+
+def convert_file(log_txt):
+    """Convert one log and write the TSV next to it (it runs in a separate
+    process)
+
+    Returns
+    -------
+    int
+        number of rows in the TSV
+    """
+    tsv = convert_log_to_tsv(log_txt)
+    tsv.to_csv(log_txt.with_suffix('.tsv'), index=False, sep='\t', float_format='%.3f')
+    return tsv.shape[0]
+
+
+def convert_logs(logs, workers=None, force=False):
+    """Convert the logs in parallel, apart from those that are up to date
+    (unless force)
+
+    Returns
+    -------
+    dict
+        for each log, 'converted', 'up to date' or the error message
+    """
+    status = {}
+    to_convert = []
+    for log_txt in logs:
+        if not force and is_up_to_date(log_txt):
+            status[log_txt] = 'up to date'
+        else:
+            to_convert.append(log_txt)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_file, log_txt): log_txt for log_txt in to_convert}
+        for future in as_completed(futures):
+            log_txt = futures[future]
+            try:
+                n_rows = future.result()
+            except Exception as err:
+                status[log_txt] = f'{type(err).__name__}: {err}'
+            else:
+                status[log_txt] = 'converted'
+                print(f'{log_txt.name}: {n_rows} events')
+
+    return {log_txt: status[log_txt] for log_txt in logs}
+
+
+def write_index(logs, index_tsv):
+    """Combine the TSV of all the sessions, with the name of the log"""
+    sessions = []
+    for log_txt in logs:
+        tsv = read_csv(log_txt.with_suffix('.tsv'), sep='\t', dtype={'value': str}, keep_default_na=False)
+        tsv.insert(0, 'session', log_txt.stem)
+        sessions.append(tsv)
+    concat(sessions).to_csv(index_tsv, index=False, sep='\t', float_format='%.3f')
+
+
+def _events_file(log_txt):
+    return log_txt.parent / (log_txt.stem + '_events.bin')
+
+
+def _frames_file(log_txt):
+    return log_txt.parent / (log_txt.stem + '_frames.npz')
+
+
 def main():
     parser = ArgumentParser(prog='convert txt to tsv')
     parser.add_argument(
         'input',
-        nargs='?',
-        help='output of qttasks, with extension ".txt", to ".tsv"')
+        nargs='*',
+        default=[str(LOG_DIR), ],
+        help='output of qttasks, with extension ".txt", to ".tsv". It can also '
+        'be a folder or a pattern (default: the log folder)')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='number of processes (default: number of CPUs)')
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='convert the logs again, even if the TSV is up to date')
+    parser.add_argument(
+        '--index',
+        help='TSV combining all the sessions (default: index.tsv in the '
+        'folder of the logs, if there is more than one log)')
     args = parser.parse_args()
 
-    log_txt = Path(args.input).resolve()
-    tsv = convert_log_to_tsv(log_txt)
-
-    out_tsv = log_txt.with_suffix('.tsv')
-    assert not out_tsv.exists()
-    tsv.to_csv(out_tsv, index=False, sep='\t', float_format='%.3f')
+    logs = find_logs(args.input)
+    if len(logs) == 0:
+        print('No logs to convert')
+        return
+
+    status = convert_logs(logs, args.workers, args.force)
+
+    print(f'{len(logs)} logs:')
+    for log_txt, log_status in status.items():
+        print(f'  {log_txt.name}: {log_status}')
+    n_converted = sum(1 for x in status.values() if x == 'converted')
+    n_up_to_date = sum(1 for x in status.values() if x == 'up to date')
+    n_failed = len(status) - n_converted - n_up_to_date
+    print(f'converted: {n_converted}, up to date: {n_up_to_date}, failed: {n_failed}')
+
+    converted = [x for x, log_status in status.items() if log_status in ('converted', 'up to date')]
+    if args.index is not None:
+        index_tsv = Path(args.index)
+    elif len(converted) > 1:
+        index_tsv = Path(commonpath(converted)) / INDEX_TSV
+    else:
+        return
+    write_index(converted, index_tsv)
+    print(f'Index of {len(converted)} sessions saved to {index_tsv}')
+
+
+if __name__ == '__main__':
+    main()
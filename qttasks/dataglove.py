@@ -1,12 +1,26 @@
-"""
-TODO
-----
-how to handle 2 datagloves
-"""
-import time
+from concurrent.futures import ThreadPoolExecutor
+from json import dump, load
+from logging import getLogger
+from multiprocessing.shared_memory import SharedMemory
 from pathlib import Path
-
-from ctypes import cdll, create_string_buffer, byref, c_ushort, c_int, pointer, c_bool, c_float
+from threading import Event, Thread
+from time import perf_counter_ns
+
+from ctypes import (
+    CFUNCTYPE,
+    byref,
+    c_bool,
+    c_float,
+    c_int,
+    c_ushort,
+    c_void_p,
+    cdll,
+    create_string_buffer,
+    pointer,
+    )
+from numpy import arange, array, dtype as np_dtype, fromfile, frombuffer, ndarray, take
+
+lg = getLogger('qttask')
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 
@@ -30,56 +44,88 @@ GLOVE_TYPE = {
     10: 'GLOVE14U_USB',
     }
 
+DEFAULT_PACKET_RATE = 75  # Hz, if the glove does not report it
+BLOCK_SIZE = 256  # samples written to file at once
+N_BLOCKS = 16  # the ring buffer keeps the last N_BLOCKS * BLOCK_SIZE samples
+CAPTURE_MODES = ('polling', 'callback')
+MAX_GLOVES = 4  # USB ports to look for gloves
+GLOVE_DLL = SCRIPT_DIR / 'include' / 'fglove.dll'
 
-def func(f, glove):
-
-    done = time.time()
-    elapsed = done - glove.start
-    data = glove.get_sensor_raw_all()
-    v = ', '.join(map(str, data))
-    glove.f.write(f'{elapsed: 16.3f}\t{v}\n')
+# void (*)(LPVOID param), called by the DLL when a new packet arrives
+GLOVE_CALLBACK = CFUNCTYPE(None, c_void_p)
 
 
-class FiveDTGlove:
-    """
-    glove = FiveDTGlove(Path('logfile.txt'))
-    glove.open(b'USB0')
+def load_glove_dll(dll_file):
+    """Load the 5DT library (or a library with the same functions)
 
-    CMPFUNC = CFUNCTYPE(None, c_int)
-    c_func = CMPFUNC(partial(func, glove=glove))
-    glove.callback(c_func)
+    Returns
+    -------
+    CDLL or None
+        None if the library could not be loaded
     """
     try:
-        gloveDLL = cdll.LoadLibrary(str(SCRIPT_DIR / "include/fglove.dll"))
+        gloveDLL = cdll.LoadLibrary(str(dll_file))
     except OSError as err:
         print('Could not initialize dataglove')
         print(err)
-        gloveDLL = None
+        return None
+
+    gloveDLL.fdOpen.restype = c_void_p
+    gloveDLL.fdNewData.restype = c_bool
+    gloveDLL.fdGetAutoCalibrate.restype = c_bool
+    return gloveDLL
+
+
+class FiveDTGlove:
+    """
+    glove = FiveDTGlove()
+    glove.open(b'USB0')
+    recorder = GloveRecorder(glove, Path('log_dataglove0.bin'), mode='callback')
+    recorder.start()
+
+    Use FiveDTGlove.load_library to use another DLL than include/fglove.dll
+    """
+    gloveDLL = load_glove_dll(GLOVE_DLL)
 
-    def __init__(self, logfile):
-        self.logfile = logfile
+    def __init__(self):
         if self.gloveDLL is None:
             raise IOError("Could not open fglove.dll")
-        self.start = time.time()
 
     @classmethod
-    def scan_USB(cls):
-        """I get access violation writing ..."""
-        if cls.gloveDLL is not None:
-            return cls.gloveDLL.fdScanUSB('')
+    def load_library(cls, dll_file):
+        """Use the library in dll_file for all the gloves"""
+        cls.gloveDLL = load_glove_dll(dll_file)
+        return cls.gloveDLL is not None
+
+    @classmethod
+    def scan_USB(cls, max_gloves=MAX_GLOVES):
+        """Number of gloves connected to USB (they are USB0, USB1, ...).
+
+        fdScanUSB fills an array of product IDs and takes the length of the
+        array by reference (passing a string caused an access violation).
+        """
+        if cls.gloveDLL is None:
+            return 0
+        product_ids = (c_ushort * max_gloves)()
+        n_max = c_int(max_gloves)
+        return cls.gloveDLL.fdScanUSB(product_ids, byref(n_max))
 
     def open(self, port):
         """port should be a binary file, like b'USB0'
         """
-        self.glovePntr = 0
-        self.glovePntr = self.gloveDLL.fdOpen(port)
-        if self.glovePntr == 0:
-            raise IOError("Could not connect to 5DT glove.")
-        self.f = self.logfile.open('w+')
+        glovePntr = self.gloveDLL.fdOpen(port)
+        if not glovePntr:
+            raise IOError(f"Could not connect to 5DT glove on {port.decode()}.")
+        self.port = port.decode()
+        self.glovePntr = c_void_p(glovePntr)
         self.num_sensors = self.get_num_sensors()
+        # buffers for all the sensors, also as numpy arrays (without copy)
+        self.raw = (c_ushort * self.num_sensors)()
+        self.raw_array = frombuffer(self.raw, dtype='<u2')
+        self.scaled = (c_float * self.num_sensors)()
+        self.scaled_array = frombuffer(self.scaled, dtype='<f4')
 
     def close(self):
-        self.f.close()
         self.gloveDLL.fdClose(self.glovePntr)
 
     def get_glove_hand(self):
@@ -94,18 +140,26 @@ class FiveDTGlove:
     def get_sensor_raw(self, index):
         return self.gloveDLL.fdGetSensorRaw(self.glovePntr, index)
 
-    def get_sensor_raw_all(self):
-        data = (c_ushort * self.num_sensors)()
-        self.gloveDLL.fdGetSensorRawAll(self.glovePntr, data)
-        DATA_GLOVE_INDEX = [0, 3, 6, 9, 12]
-        return [data[i] for i in DATA_GLOVE_INDEX]
+    def read_raw(self):
+        """Read all the sensors into self.raw / self.raw_array (the buffer is
+        allocated only once, in open)"""
+        self.gloveDLL.fdGetSensorRawAll(self.glovePntr, self.raw)
+
+    def read_scaled(self):
+        """Read all the sensors, scaled between 0 and 1 with the calibration,
+        into self.scaled / self.scaled_array"""
+        self.gloveDLL.fdGetSensorScaledAll(self.glovePntr, self.scaled)
 
-    def get_sensor_scaled_all(self):
-        data = (c_float * self.num_sensors)()
-        self.gloveDLL.fdGetSensorRawAll(self.glovePntr, data)
+    def get_sensor_raw_all(self, sensors=None):
+        """Raw values of the sensors (index of the sensors, or None for all)"""
+        self.read_raw()
+        return _select(self.raw_array, sensors)
 
-        DATA_GLOVE_INDEX = [0, 3, 6, 9, 12]
-        return [data[i] for i in DATA_GLOVE_INDEX]
+    def get_sensor_scaled_all(self, sensors=None):
+        """Scaled values of the sensors (index of the sensors, or None for
+        all)"""
+        self.read_scaled()
+        return _select(self.scaled_array, sensors)
 
     def get_calibration(self, index):
         calibrationUpper = c_ushort(0)
@@ -134,18 +188,17 @@ class FiveDTGlove:
         return charBuffer.value.decode()
 
     def callback(self, func):
-        self.f.write('started\n')
-        self.gloveDLL.fdSetCallback(self.glovePntr, func, c_int(1))
+        """func is a GLOVE_CALLBACK (keep a reference to it until
+        remove_callback)"""
+        self.gloveDLL.fdSetCallback(self.glovePntr, func, None)
 
-    def remove_callback(self, func):
+    def remove_callback(self):
         self.gloveDLL.fdRemoveCallback(self.glovePntr)
-        self.f.write('finished\n')
 
     def get_packet_rate(self):
         return self.gloveDLL.fdGetPacketRate(self.glovePntr)
 
     def new_data(self):
-        self.gloveDLL.fdNewData.restype = c_bool
         return self.gloveDLL.fdNewData(self.glovePntr)
 
     def get_FW_version_major(self):
@@ -155,9 +208,260 @@ class FiveDTGlove:
         return self.gloveDLL.fdGetFWVersionMinor(self.glovePntr)
 
     def get_autocalibrate(self):
-        self.gloveDLL.fdGetAutoCalibrate.restype = c_bool
         return self.gloveDLL.fdGetAutoCalibrate(self.glovePntr)
 
     def set_autocalibrate(self, value):
         self.gloveDLL.fdSetAutoCalibrate(self.glovePntr, c_bool(value))
 
+
+def discover_gloves(max_gloves=MAX_GLOVES):
+    """Find the gloves connected to USB and open them in parallel (opening a
+    glove takes some time).
+
+    If fdScanUSB fails or does not find any glove, it tries to open the first
+    max_gloves USB ports.
+
+    Returns
+    -------
+    list of FiveDTGlove
+        opened gloves, in the order of the USB ports
+    """
+    if FiveDTGlove.gloveDLL is None:
+        return []
+
+    try:
+        n_gloves = FiveDTGlove.scan_USB(max_gloves)
+    except OSError as err:  # access violation, on Windows
+        lg.warning(f'Could not scan USB for gloves: {err}')
+        n_gloves = 0
+    if n_gloves <= 0:
+        n_gloves = max_gloves
+    ports = [f'USB{i}'.encode() for i in range(min(n_gloves, max_gloves))]
+
+    with ThreadPoolExecutor(max_workers=len(ports)) as executor:
+        results = list(executor.map(_open_glove, ports))
+    gloves = [glove for glove in results if glove is not None]
+    for glove in gloves:
+        lg.info(f'Dataglove on {glove.port}: {glove.get_glove_hand()} {glove.get_glove_type()} ({glove.num_sensors} sensors)')
+    return gloves
+
+
+def _open_glove(port):
+    glove = FiveDTGlove()
+    try:
+        glove.open(port)
+    except IOError:
+        return None
+    return glove
+
+
+class GloveRecorder(Thread):
+    """Sample the glove in a separate thread, so that the frame loop never
+    waits for the glove.
+
+    With mode 'polling', the thread checks for new packets twice per packet
+    (fdGetPacketRate). With mode 'callback', the DLL calls record when a new
+    packet arrives (fdSetCallback) and the thread only waits until it's
+    stopped.
+
+    Each packet is copied, with the time when it arrived (perf_counter_ns,
+    like the triggers and the frames), in a ring buffer in shared memory
+    (see attach_glove), without allocating memory. The thread (never the
+    callback) writes each block of BLOCK_SIZE samples to the binary file,
+    which can be read with read_glove.
+
+    Parameters
+    ----------
+    glove : FiveDTGlove
+        opened glove
+    glove_file : Path
+        .bin file to write (a .json file with the dtype is written next to it)
+    t_zero : int
+        time of trigger 250 (perf_counter_ns), to align the samples with the
+        triggers
+    mode : str
+        one of CAPTURE_MODES
+    sensors : list of int or None
+        index of the sensors to record (None for all)
+    scaled : bool
+        record the scaled values (float, with fdGetSensorScaledAll) instead of
+        the raw values
+    """
+    def __init__(self, glove, glove_file, t_zero=0, mode='polling', sensors=None, scaled=False):
+        super().__init__(daemon=True)
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f'mode should be one of {CAPTURE_MODES}, not "{mode}"')
+        if sensors is None:
+            sensors = arange(glove.num_sensors)
+        sensors = array(sensors, dtype=int)
+        if ((sensors < 0) | (sensors >= glove.num_sensors)).any():
+            raise ValueError(f'{glove.get_glove_type()} has {glove.num_sensors} sensors, it cannot record sensors {sensors.tolist()}')
+        self.glove = glove
+        self.glove_file = glove_file
+        self.mode = mode
+        self.stopped = Event()
+        self.f = None
+        self.n_written = 0
+
+        packet_rate = glove.get_packet_rate()
+        if packet_rate <= 0:
+            packet_rate = DEFAULT_PACKET_RATE
+        self.packet_rate = packet_rate
+
+        self.shm, self.count, self.ring = _allocate_ring(sensors.shape[0], scaled)
+        self._time = self.ring['time']
+        self._sensors = self.ring['sensors']
+        self._sensor_index = sensors
+        if scaled:
+            self._read = glove.read_scaled
+            self._values = glove.scaled_array
+        else:
+            self._read = glove.read_raw
+            self._values = glove.raw_array
+
+        header = {
+            'hand': glove.get_glove_hand(),
+            'type': glove.get_glove_type(),
+            'packet_rate': packet_rate,
+            'num_sensors': glove.num_sensors,
+            'sensors': sensors.tolist(),
+            'scaled': scaled,
+            'mode': mode,
+            't_zero': t_zero,
+            }
+        with glove_file.with_suffix('.json').open('w') as f:
+            dump(header, f)
+
+    @property
+    def n_samples(self):
+        return int(self.count[0])
+
+    @property
+    def shm_name(self):
+        """name of the shared memory (see attach_glove), None after the end"""
+        return None if self.shm is None else self.shm.name
+
+    def record(self):
+        """Read the new packet and store it (in the thread of the DLL, with
+        mode 'callback')"""
+        t = perf_counter_ns()
+        self._read()
+        n = self.count[0]
+        i = n % self._time.shape[0]
+        self._time[i] = t
+        take(self._values, self._sensor_index, out=self._sensors[i], mode='clip')
+        self.count[0] = n + 1
+
+    def flush(self, final=False):
+        """Write the complete blocks (and the last, partial block if final)
+        to the file, in the thread of the recorder"""
+        n = self.n_samples
+        n_ring = self.ring.shape[0]
+        if n - self.n_written > n_ring - BLOCK_SIZE:
+            n_lost = n - self.n_written - (n_ring - BLOCK_SIZE)
+            lg.warning(f'{self.glove_file.name}: {n_lost} samples were overwritten before they were written to file')
+            self.n_written += n_lost
+        while n - self.n_written >= BLOCK_SIZE or (final and n > self.n_written):
+            i = self.n_written % n_ring
+            n_block = min(BLOCK_SIZE - i % BLOCK_SIZE, n - self.n_written)
+            self.f.write(self.ring[i:i + n_block])
+            self.n_written += n_block
+
+    def run(self):
+        with self.glove_file.open('wb') as self.f:
+            if self.mode == 'callback':
+                callback = GLOVE_CALLBACK(lambda param: self.record())
+                self.glove.callback(callback)
+                # check twice per block
+                interval = BLOCK_SIZE / self.packet_rate / 2
+                while not self.stopped.wait(interval):
+                    self.flush()
+                self.glove.remove_callback()
+
+            else:
+                interval = 1 / self.packet_rate / 2
+                while not self.stopped.wait(interval):
+                    if self.glove.new_data():
+                        self.record()
+                        self.flush()
+
+            self.flush(final=True)
+
+        lg.info(f'{self.glove_file.name}: {self.n_samples} samples')
+        self._release()
+
+    def _release(self):
+        """Keep a copy of the ring buffer and free the shared memory"""
+        self.count = self.count.copy()
+        self.ring = self.ring.copy()
+        self._time = self._sensors = None
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    @property
+    def latest(self):
+        """Last sample (time and sensors), or None if there are no samples"""
+        if self.n_samples == 0:
+            return None
+        return self.ring[(self.n_samples - 1) % self.ring.shape[0]]
+
+    def stop(self):
+        """Write the remaining samples and close the file (it does not wait,
+        use join for that)"""
+        self.stopped.set()
+
+
+def _select(values, sensors):
+    if sensors is None:
+        return values.copy()
+    return values[sensors]
+
+
+def _ring_dtype(n_sensors, scaled=False):
+    return np_dtype([('time', '<i8'), ('sensors', '<f4' if scaled else '<u2', (n_sensors, ))])
+
+
+def _allocate_ring(n_sensors, scaled=False, name=None):
+    """The shared memory contains the number of samples (int64) and then the
+    ring buffer"""
+    dtype = _ring_dtype(n_sensors, scaled)
+    n_ring = N_BLOCKS * BLOCK_SIZE
+    if name is None:
+        shm = SharedMemory(create=True, size=8 + n_ring * dtype.itemsize)
+    else:
+        shm = SharedMemory(name=name)
+    count = ndarray(1, dtype='<i8', buffer=shm.buf)
+    ring = ndarray(n_ring, dtype=dtype, buffer=shm.buf, offset=8)
+    return shm, count, ring
+
+
+def attach_glove(shm_name, n_sensors, scaled=False):
+    """Read the ring buffer of a GloveRecorder from another process (with the
+    number of recorded sensors and if they are scaled).
+
+    Returns
+    -------
+    SharedMemory
+        close it after deleting count and ring
+    ndarray
+        number of samples recorded so far (one value)
+    ndarray
+        ring buffer, sample n is at n % its length
+    """
+    return _allocate_ring(n_sensors, scaled, shm_name)
+
+
+def read_glove(glove_file):
+    """Read the samples written by GloveRecorder
+
+    Returns
+    -------
+    ndarray
+        with 'time' (perf_counter_ns) and 'sensors' (n_samples x recorded
+        sensors, see 'sensors' in the .json file)
+    """
+    with glove_file.with_suffix('.json').open() as f:
+        header = load(f)
+    dtype = _ring_dtype(len(header['sensors']), header['scaled'])
+    return fromfile(glove_file, dtype=dtype)
@@ -0,0 +1,93 @@
+from json import dump
+from pathlib import Path
+from struct import Struct
+from time import perf_counter_ns
+
+from numpy import unique
+
+from .fast import FastSequence
+
+EVENTS_VERSION = 1
+# time (perf_counter_ns), event, trigger, index of the trial, index of the stimulus
+EVENT = Struct('<qBhii')
+EVENT_DTYPE = [
+    ('time', '<i8'),
+    ('event', 'u1'),
+    ('trigger', '<i2'),
+    ('trial', '<i4'),
+    ('stim', '<i4'),
+    ]
+EVENTS = {
+    'trigger': 1,  # trigger sent to the serial port
+    'present': 2,  # stimulus presented (trigger is the trial_type)
+    'input': 3,  # trigger received from the serial port
+    'start': 4,
+    'pause': 5,
+    'resume': 6,
+    'stop': 7,
+    }
+BUFFER_SIZE = 2 ** 16
+
+
+class EventLog:
+    """Write the events in a binary file, with fixed-size records (EVENT),
+    which can be read with numpy.fromfile(events_file, EVENT_DTYPE).
+
+    A .json file next to it contains the names of the events, the names of the
+    trials and the names of the stimuli (stim is the index in this list).
+
+    Parameters
+    ----------
+    events_file : Path or None
+        .bin file to write (if None, the events are not written)
+    stimuli : ndarray
+        schedule of the task (see read_stimuli)
+    task_dir : Path
+        the names of the stimuli are relative to this folder
+    """
+    def __init__(self, events_file, stimuli, task_dir):
+        self.f = None
+        if events_file is None:
+            return
+
+        names = [_stim_name(stim, task_dir) for stim in stimuli['stim_file']]
+        stim_names, self.stim_ids = unique(names, return_inverse=True)
+        self.stim_ids = self.stim_ids.tolist()
+
+        header = {
+            'version': EVENTS_VERSION,
+            'format': EVENT.format,
+            'events': EVENTS,
+            'trial_name': [str(x) for x in stimuli['trial_name']],
+            'stimuli': stim_names.tolist(),
+            }
+        with events_file.with_suffix('.json').open('w') as f:
+            dump(header, f)
+        self.f = events_file.open('wb', buffering=BUFFER_SIZE)
+
+    def write(self, event, trigger=-1, trial=-1, t=None):
+        """Write one event (use the names in EVENTS). If t is None, it uses the
+        current time."""
+        if self.f is None:
+            return
+        if t is None:
+            t = perf_counter_ns()
+        stim = -1 if trial == -1 else self.stim_ids[trial]
+        self.f.write(EVENT.pack(t, EVENTS[event], trigger, trial, stim))
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+def _stim_name(stim, task_dir):
+    if isinstance(stim, FastSequence):
+        return 'FAST'
+    elif isinstance(stim, Path):
+        try:
+            return stim.relative_to(task_dir).as_posix()
+        except ValueError:
+            return stim.as_posix()
+    else:
+        return str(stim)
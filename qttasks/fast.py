@@ -0,0 +1,81 @@
+from logging import getLogger
+
+from numpy import arange, searchsorted
+
+lg = getLogger('qttask')
+
+
+class FastSequence:
+    """Present a fast sequence of images, one frame at a time.
+
+    Which image to show at each frame is computed only once. The time of each
+    buffer swap is used to check if frames were dropped: if so, the sequence
+    skips ahead, so that the following images are still presented at the
+    right time.
+
+    Parameters
+    ----------
+    tsv : ndarray
+        table of the fast sequence (see read_fast_stimuli), with onset and
+        duration in frames
+    """
+    def __init__(self, tsv):
+        self.tsv = tsv
+        self.n_frames = int(tsv['onset'][-1])
+        # index of the row for each frame
+        i_rows = searchsorted(tsv['onset'], arange(self.n_frames), side='right') - 1
+        self.frames = list(tsv['stim_file'][i_rows])
+
+        self.frame_period = None
+        self.i_frame = 0
+        self.t_first = None
+        self.n_dropped = 0
+
+    @property
+    def images(self):
+        return {x for x in self.tsv['stim_file'] if x is not None}
+
+    @property
+    def finished(self):
+        return self.i_frame >= self.n_frames
+
+    @property
+    def current(self):
+        """Image of the frame to draw (None for a blank frame)"""
+        return self.frames[self.i_frame]
+
+    def start(self, refresh_rate):
+        """Start from the first frame
+
+        Parameters
+        ----------
+        refresh_rate : float
+            refresh rate of the screen, in Hz
+        """
+        self.frame_period = 1e9 / refresh_rate
+        self.i_frame = 0
+        self.t_first = None
+        self.n_dropped = 0
+
+    def swapped(self, t_swap):
+        """The current frame was swapped to the screen. Move on to the next
+        frame, or skip the frames that were late.
+
+        Parameters
+        ----------
+        t_swap : int
+            time of the buffer swap (perf_counter_ns)
+        """
+        if self.t_first is None:
+            self.t_first = t_swap
+
+        else:
+            i_shown = int(round((t_swap - self.t_first) / self.frame_period))
+            if i_shown > self.i_frame:
+                lg.warning(f'Fast sequence: dropped {i_shown - self.i_frame} frames at frame #{self.i_frame}')
+                self.n_dropped += i_shown - self.i_frame
+                self.i_frame = i_shown
+
+        self.i_frame += 1
+        if self.finished and self.n_dropped > 0:
+            lg.warning(f'Fast sequence: dropped {self.n_dropped} frames in total')
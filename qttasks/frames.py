@@ -0,0 +1,105 @@
+from logging import getLogger
+
+from numpy import diff, empty, full, median, percentile, savez
+
+lg = getLogger('qttask')
+
+CHUNK = 2 ** 14  # number of frames to allocate at once
+OUTLIER = 1.5  # a frame is late if it takes longer than OUTLIER * frame period
+
+
+class FrameTimer:
+    """Record the time of each buffer swap (perf_counter_ns) and which trial or
+    frame of a fast sequence was shown. Frames that take much longer than
+    the frame period are logged, with the number of vsyncs that were missed.
+
+    At the end, the frames are saved in a .npz file:
+        - t_zero : time when trigger 250 was sent
+        - t_swap : time of each buffer swap
+        - trial : index of the trial that started in this frame, -1 if the
+                  stimulus did not change
+        - fast : index of the frame in the fast sequence, -1 otherwise
+
+    Parameters
+    ----------
+    frames_file : Path or None
+        .npz file to write (if None, the frames are not saved)
+    """
+    def __init__(self, frames_file=None):
+        self.frames_file = frames_file
+        self.t_zero = 0  # time of trigger 250
+        self.frame_period = None  # ns
+        self.t_swap = empty(CHUNK, dtype='int64')
+        self.trial = full(CHUNK, -1, dtype='int32')
+        self.fast = full(CHUNK, -1, dtype='int32')
+        self.n_frames = 0
+        self.continuous = False
+        self.n_outliers = 0
+        self.n_missed = 0
+        self.closed = False
+
+    @property
+    def t_last(self):
+        """time of the last buffer swap"""
+        return int(self.t_swap[self.n_frames - 1])
+
+    def swapped(self, t_swap, trial=-1, fast=-1, continuous=False):
+        """Record a buffer swap.
+
+        Parameters
+        ----------
+        t_swap : int
+            time of the buffer swap (perf_counter_ns)
+        trial : int
+            index of the trial that started in this frame
+        fast : int
+            index of the frame in the fast sequence
+        continuous : bool
+            if a frame is drawn at each vsync (so that the time between this
+            frame and the previous one can be checked)
+        """
+        i = self.n_frames
+        if i == self.t_swap.shape[0]:
+            self._grow()
+        self.t_swap[i] = t_swap
+        self.trial[i] = trial
+        self.fast[i] = fast
+        self.n_frames += 1
+
+        if continuous and self.continuous and self.frame_period is not None:
+            interval = t_swap - self.t_swap[i - 1]
+            if interval > OUTLIER * self.frame_period:
+                n_missed = int(round(interval / self.frame_period)) - 1
+                self.n_outliers += 1
+                self.n_missed += n_missed
+                lg.warning(f'Frame #{i} took {interval / 1e6:.1f} ms ({n_missed} missed vsyncs)')
+        self.continuous = continuous
+
+    def close(self):
+        """Log the summary and save the frames"""
+        if self.closed or self.n_frames == 0:
+            return
+        self.closed = True
+
+        t_swap = self.t_swap[:self.n_frames]
+        if self.n_frames > 1:
+            interval = diff(t_swap) / 1e6
+            lg.info(f'Frames: {self.n_frames}, interval median {median(interval):.2f} ms, '
+                    f'99% {percentile(interval, 99):.2f} ms, late frames {self.n_outliers}, '
+                    f'missed vsyncs {self.n_missed}')
+
+        if self.frames_file is not None:
+            savez(
+                self.frames_file,
+                t_zero=self.t_zero,
+                t_swap=t_swap,
+                trial=self.trial[:self.n_frames],
+                fast=self.fast[:self.n_frames],
+                )
+
+    def _grow(self):
+        self.t_swap.resize(self.t_swap.shape[0] + CHUNK, refcheck=False)
+        for values in (self.trial, self.fast):
+            n = values.shape[0]
+            values.resize(n + CHUNK, refcheck=False)
+            values[n:] = -1
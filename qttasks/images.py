@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from pathlib import Path
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QImage, QPixmap
+
+lg = getLogger('qttask')
+
+IMAGE_SUFFIXES = ('.png', '.jpg')
+
+
+class PixmapCache:
+    """Decode the images only when they are needed and keep them in memory,
+    up to a memory budget. When the budget is exceeded, the images that were
+    used least recently are dropped.
+
+    The images are decoded into QImage by a pool of threads (prefetch), and
+    they are converted to QPixmap in the main thread (collect).
+
+    Images that are pinned (such as those in fast sequences) and the image
+    that was used last (the one on the screen) are never dropped. If the
+    pinned images do not fit in the budget, the budget is exceeded, with a
+    warning.
+
+    Once the size of the window is known (set_size), the images are also
+    scaled to fit the window by the pool of threads, so that they can be drawn
+    without rescaling at every frame. Only the scaled image is kept. When the
+    size changes, the images in memory are decoded and scaled again in the
+    background, and the old ones are used until then.
+
+    Parameters
+    ----------
+    memory : int or None
+        memory budget, in MB. If None, the images are never dropped.
+    workers : int or None
+        number of threads to decode images. If None, it depends on the number
+        of CPUs.
+    """
+    def __init__(self, memory=None, workers=None):
+        if memory is None:
+            self.budget = None
+        else:
+            self.budget = memory * 1024 ** 2
+        self.pixmaps = OrderedDict()
+        self.stale = set()  # scaled to the previous size of the window
+        self.pinned = set()
+        self.current = None  # image used last
+        self.warned_budget = False
+        self.size = None
+        self.nbytes = 0
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = OrderedDict()
+        self.n_requested = 0
+        self.n_collected = 0
+
+    def __contains__(self, img_file):
+        return img_file in self.pixmaps
+
+    def __getitem__(self, img_file):
+        """Return the pixmap (scaled to fit the window, once set_size was
+        called)"""
+        self.current = img_file
+        if img_file in self.pixmaps and img_file not in self.stale:
+            self.pixmaps.move_to_end(img_file)
+            return self.pixmaps[img_file]
+
+        if img_file in self.pending:
+            lg.debug(f'Image {img_file} was still being decoded')
+            image = self.pending.pop(img_file).result()
+            self.n_collected += 1
+        else:
+            lg.debug(f'Image {img_file} was not in the cache')
+            image = _decode(img_file, self.size)
+        pixmap = self.add(img_file, image)
+        self.pixmaps.move_to_end(img_file)
+        return pixmap
+
+    def add(self, img_file, image):
+        pixmap = QPixmap.fromImage(image)
+        old = self.pixmaps.get(img_file)
+        if old is not None:
+            self.nbytes -= _nbytes(old)
+        self.pixmaps[img_file] = pixmap
+        self.stale.discard(img_file)
+        self.nbytes += _nbytes(pixmap)
+        self.evict()
+        return pixmap
+
+    def scaled(self, img_file):
+        """Return the pixmap, scaled to fit the window"""
+        return self[img_file]
+
+    def set_size(self, size):
+        """Decode and scale the images again for the new size of the window,
+        in the background (the current image first). Until then, the images
+        scaled to the old size are used."""
+        if size == self.size:
+            return
+        self.size = size
+
+        for future in self.pending.values():
+            future.cancel()
+        img_files = list(self.pending) + list(self.pixmaps)
+        if self.current in self.pixmaps:
+            img_files.insert(0, self.current)
+        self.n_requested += len(self.pixmaps.keys() - self.pending.keys())
+        self.pending.clear()
+        self.stale.update(self.pixmaps)
+        for img_file in img_files:
+            if img_file not in self.pending:
+                self.pending[img_file] = self.executor.submit(_decode, img_file, size)
+
+    def prefetch(self, img_files):
+        """Start decoding these images in the background, if they are not in
+        memory yet (in the order in which they will be used)"""
+        for img_file in img_files:
+            if img_file in self.pixmaps:
+                self.pixmaps.move_to_end(img_file)
+            elif img_file not in self.pending:
+                self.pending[img_file] = self.executor.submit(_decode, img_file, self.size)
+                self.n_requested += 1
+
+    def collect(self):
+        """Convert the images that were decoded to pixmaps. It needs to be
+        called from the main thread.
+
+        Returns
+        -------
+        int
+            number of images that are still being decoded
+        """
+        done = [img_file for img_file, future in self.pending.items() if future.done()]
+        for img_file in done:
+            self.add(img_file, self.pending.pop(img_file).result())
+        self.n_collected += len(done)
+        return len(self.pending)
+
+    def pin(self, img_files):
+        """Keep these images in memory, and start decoding them"""
+        img_files = list(img_files)
+        self.pinned.update(img_files)
+        self.prefetch(img_files)
+
+    def unpin(self, img_files):
+        """These images can be dropped again"""
+        self.pinned.difference_update(img_files)
+        self.evict()
+
+    def is_resident(self, img_files):
+        return all(img_file in self.pixmaps for img_file in img_files)
+
+    def evict(self):
+        if self.budget is None or self.nbytes <= self.budget:
+            return
+
+        # always keep the most recent image, even if it's larger than budget
+        for img_file in list(self.pixmaps)[:-1]:
+            if self.nbytes <= self.budget:
+                break
+            if img_file in self.pinned or img_file == self.current:
+                continue
+            self.nbytes -= _nbytes(self.pixmaps.pop(img_file))
+            self.stale.discard(img_file)
+
+        if self.nbytes > self.budget and not self.warned_budget:
+            lg.warning(
+                f'The images that need to stay in memory use {self.nbytes / 1024 ** 2:.0f} MB, '
+                f'more than CACHE MEMORY ({self.budget / 1024 ** 2:.0f} MB)')
+            self.warned_budget = True
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+
+def is_image(stim):
+    return isinstance(stim, Path) and stim.suffix in IMAGE_SUFFIXES
+
+
+def _decode(img_file, size=None):
+    """Decode the image and scale it to fit size (it can run in any thread)"""
+    image = QImage(str(img_file))
+    if size is not None:
+        image = image.scaled(size, Qt.KeepAspectRatio)
+    return image
+
+
+def _nbytes(pixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
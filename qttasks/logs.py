@@ -0,0 +1,80 @@
+from logging import (
+    DEBUG,
+    WARNING,
+    FileHandler,
+    Filter,
+    Formatter,
+    StreamHandler,
+    getLogger,
+    )
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from time import monotonic
+
+# convert_log_to_tsv depends on this format
+LOG_FORMAT = '%(asctime)s.%(msecs)03d\t%(name)s\t%(levelname)s\t%(message)s'
+LOG_DATEFMT = '%H:%M:%S'
+FLUSH_INTERVAL = 1  # s
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Only put the record in the queue: it is formatted and written by the
+    QueueListener, in its own thread. The precise time of the triggers and
+    of the stimuli is in the events file (see EventLog), not in the log."""
+    def prepare(self, record):
+        return record
+
+
+class BufferedFileHandler(FileHandler):
+    """Flush the file every FLUSH_INTERVAL s (and for warnings and errors),
+    instead of after each record"""
+    t_flush = 0
+
+    def emit(self, record):
+        super().emit(record)
+        if record.levelno >= WARNING:
+            self.flush(force=True)
+
+    def flush(self, force=False):
+        t = monotonic()
+        if force or t - self.t_flush >= FLUSH_INTERVAL:
+            super().flush()
+            self.t_flush = t
+
+    def close(self):
+        self.flush(force=True)
+        super().close()
+
+
+def start_logging(logname):
+    """Log to file (all the messages) and to the console (only qttask). The
+    loggers only put the records in a queue, the files are written in a
+    separate thread.
+
+    Returns
+    -------
+    QueueListener
+        use stop_logging at the end, to write the remaining records
+    """
+    file_handler = BufferedFileHandler(logname, mode='w')
+    file_handler.setFormatter(Formatter(LOG_FORMAT, datefmt=LOG_DATEFMT))
+    console_handler = StreamHandler()
+    console_handler.addFilter(Filter('qttask'))
+
+    queue = SimpleQueue()
+    listener = QueueListener(queue, file_handler, console_handler, respect_handler_level=True)
+    root = getLogger()
+    root.setLevel(DEBUG)
+    root.addHandler(DeferredQueueHandler(queue))
+    listener.start()
+    return listener
+
+
+def stop_logging(listener):
+    listener.stop()
+    root = getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, DeferredQueueHandler) and handler.queue is listener.queue:
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        handler.close()
@@ -1,3 +1,5 @@
+from json import dump, load
+from os import getpid, replace
 from pathlib import Path
 from collections.abc import Mapping
 
@@ -17,3 +19,55 @@ def update(d, u):
         else:
             d[k] = v
     return d
+
+
+def read_parameters(task, configuration=None):
+    """Merge default.json, the parameters.json of the task and the JSON of the
+    configuration. The merged parameters are saved in the compiled folder of
+    the task and used again until one of the JSON files changes (modification
+    time or size)."""
+    task_dir = TASKS_DIR / task
+    sources = [DEFAULTS_JSON, task_dir / 'parameters.json']
+    if configuration is not None:
+        sources.append(CONFIG_DIR / f'{configuration}.json')
+    key = []
+    for source in sources:
+        st = source.stat()
+        key.append([str(source), st.st_mtime_ns, st.st_size])
+
+    if configuration is None:
+        parameters_file = task_dir / 'compiled' / 'parameters.json'
+    else:
+        parameters_file = task_dir / 'compiled' / f'parameters_{configuration}.json'
+    try:
+        with parameters_file.open() as f:
+            compiled = load(f)
+        if compiled['key'] == key:
+            return compiled['parameters']
+    except (OSError, ValueError, LookupError, TypeError):
+        pass  # missing or damaged, compile it again
+
+    parameters = {}
+    for source in sources:
+        with source.open() as f:
+            parameters = update(parameters, load(f))
+
+    try:
+        parameters_file.parent.mkdir(exist_ok=True)
+        write_atomic(parameters_file, 'w', lambda f: dump({'key': key, 'parameters': parameters}, f))
+    except OSError:  # f.e. read-only installation
+        pass
+    return parameters
+
+
+def write_atomic(path, mode, write):
+    """Write to a temporary file and rename it, so that path is either the
+    old or the new file, never a partial one"""
+    tmp_file = path.with_name(f'{path.name}.{getpid()}.tmp')
+    try:
+        with tmp_file.open(mode) as f:
+            write(f)
+        replace(tmp_file, path)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
@@ -1,30 +1,20 @@
 #!/usr/bin/env python3
 
-from struct import pack, unpack
 import sys
 import logging
 from argparse import ArgumentParser
+from bisect import bisect_right
 from random import random
 from pprint import pformat
-from json import load
-from numpy import where
 from datetime import datetime
-from time import sleep
+from time import sleep, perf_counter_ns
 from pathlib import Path
 
-try:
-    from psutil import Process, HIGH_PRIORITY_CLASS  # only windows
-except ImportError:
-    Process = None
-
 from PyQt5.QtCore import (
     Qt,
-    QObject,
     QThread,
     QTime,
     QTimer,
-    pyqtSignal,
-    pyqtSlot,
     )
 from PyQt5.QtGui import (
     QColor,
@@ -33,25 +23,29 @@ from PyQt5.QtGui import (
     QMouseEvent,
     QPainter,
     )
-from PyQt5.QtMultimedia import QSound
 from PyQt5.QtWidgets import (
     QApplication,
     QOpenGLWidget,
     )
 
-from serial import Serial
+from serial import serial_for_url
 from serial import SerialException
-from serial.tools.list_ports import comports
 
-from .dataglove import FiveDTGlove
-from .paths import LOG_DIR, SOUNDS_DIR, DEFAULTS_JSON, TASKS_DIR, update, CONFIG_DIR
-from .read_tsv import read_stimuli, read_fast_stimuli
+from . import T_LAUNCH
+from .fast import FastSequence
+from .events import EventLog
+from .frames import FrameTimer
+from .images import PixmapCache, is_image
+from .logs import start_logging, stop_logging
+from .paths import LOG_DIR, SOUNDS_DIR, TASKS_DIR, CONFIG_DIR, read_parameters
+from .read_tsv import read_stimuli
+from .renderer import TextureRenderer
+from .schedule import OnsetCursor
+from .triggers import SerialInputWorker, TriggerWriter
 
-TASKS = sorted([x.stem for x in TASKS_DIR.iterdir()])
-CONFIGURATIONS = sorted([x.stem for x in CONFIG_DIR.glob('*.json')])
+LOADING_INTERVAL = 10  # ms, how often to collect the decoded images
 
 lg = logging.getLogger('qttask')
-lg.addHandler(logging.StreamHandler())
 
 
 def handle_exception(exc_type, exc_value, exc_traceback):
@@ -63,14 +57,21 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 sys.excepthook = handle_exception
 
-app = QApplication([])
+app = None  # created by start_app
+
+
+def start_app():
+    """Create the QApplication, if it does not exist yet"""
+    global app
+    if app is None:
+        app = QApplication.instance() or QApplication([])
+    return app
 
 
 class PrettyWidget(QOpenGLWidget):
     started = False
     finished = False
     timer = None
-    port_trigger = None
     current_index = None
     presenting = None
     paused = False
@@ -78,25 +79,36 @@ class PrettyWidget(QOpenGLWidget):
     cross_delay = 2
     cross_color = 'green'
     sound = {'start': None, 'end': None}
-    fast_tsv = None
-    fast_i = None
-    fast_t = None
+    fast = None
+    fast_index = None
+    next_event = None
+    img_center = (0, 0)
+    renderer = None
+    t_start = None  # perf_counter_ns
+    frame_trial = -1  # trial that was painted, but not swapped yet
+    glove = ()  # GloveRecorder of each dataglove
+    t_ready = None  # perf_counter_ns, when READY was first presented
+    warned_about_ports = False  # the available ports are listed only once
 
     def __init__(self, parameters):
+        start_app()
         super().__init__()
         self.P = parameters
 
         if self.P['SOUND']['PLAY']:
+            from PyQt5.QtMultimedia import QSound  # it needs the audio libraries
             self.sound = {
                 'start': QSound(str(SOUNDS_DIR / self.P['SOUND']['START'])),
                 'end': QSound(str(SOUNDS_DIR / self.P['SOUND']['END'])),
                 }
-        self.open_serial()
+        self.trigger_writer = TriggerWriter(self.open_serial)
+        self.trigger_writer.start()
 
         try:
-            port_input = Serial(
+            port_input = serial_for_url(
                 self.P['COM']['INPUT']['PORT'],
-                baudrate=self.P['COM']['INPUT']['BAUDRATE'])
+                baudrate=self.P['COM']['INPUT']['BAUDRATE'],
+                timeout=self.P['COM']['INPUT']['TIMEOUT'])
         except SerialException:
             port_input = None
             lg.warning('could not open serial port to read input')
@@ -106,17 +118,58 @@ class PrettyWidget(QOpenGLWidget):
 
         lg.info('Reading images')
         self.stimuli = read_stimuli(self.P)
-        lg.info('Reading images: finished')
+        self.cursor = OnsetCursor(self.stimuli['onset'])
+        self.i_images = [i for i, stim in enumerate(self.stimuli['stim_file']) if is_image(stim)]
+        i_first = [i for i in self.i_images if self.stimuli['onset'][i] < self.P['CACHE']['PRELOAD']]
+        self.first_images = set(self.stimuli['stim_file'][i_first])
+        self.fast_images = set()
+        for stim in self.stimuli['stim_file']:
+            if isinstance(stim, FastSequence):
+                self.fast_images.update(stim.images)
+        self.first_images.update(self.fast_images)
+        # the first images are unpinned after they are presented for the last
+        # time (index of the trial -> image)
+        last_first = {self.stimuli['stim_file'][i]: i for i in i_first}
+        self.unpin_after = {
+            i: img_file for img_file, i in last_first.items()
+            if img_file not in self.fast_images}
+
+        # images are decoded in the background, while showing READY. The
+        # first images are pinned until they are presented, so that they are
+        # all in memory even if they exceed the budget
+        self.images = PixmapCache(self.P['CACHE']['MEMORY'], self.P['CACHE']['WORKERS'])
+        self.loading_timer = QTimer()
+        self.loading_timer.timeout.connect(self.collect_images)
+        self.images.pin(self.first_images)
+        if self.P['CACHE']['MEMORY'] is None:
+            self.images.prefetch(self.stimuli['stim_file'][self.i_images])
+            self.loading_timer.start(LOADING_INTERVAL)
+        else:
+            self.prefetch(-1)
 
         # background color
         self.bg_color = QColor(self.P['BACKGROUND'])
 
+        logname = self.P.get('logname')
+        if logname is None:
+            frames_file = events_file = None
+        else:
+            frames_file = logname.parent / (logname.stem + '_frames.npz')
+            events_file = logname.parent / (logname.stem + '_events.bin')
+        self.frame_timer = FrameTimer(frames_file)
+        self.events = EventLog(events_file, self.stimuli, self.P['TASK_TSV'].parent)
+        self.frameSwapped.connect(self.record_frame)
+
         self.show()
 
         self.time = QTime()
         self.timer = QTimer()
         self.timer.setTimerType(Qt.PreciseTimer)
-        self.timer.timeout.connect(self.check_time)
+        if self.P['SCHEDULER']['MODE'] == 'onset':
+            self.timer.setSingleShot(True)
+            self.timer.timeout.connect(self.wait_for_onset)
+        else:
+            self.timer.timeout.connect(self.check_time)
 
         self.setCursor(Qt.BlankCursor)
         self.setGeometry(200, 200, 1000, 1000)
@@ -124,106 +177,145 @@ class PrettyWidget(QOpenGLWidget):
             self.showFullScreen()
         else:
             self.showNormal()
+        self.frame_timer.t_zero = perf_counter_ns()
         self.serial(250)
         if self.P['DATAGLOVE']:
             self.open_dataglove()
 
     def open_dataglove(self):
 
+        from .dataglove import FiveDTGlove, GloveRecorder, discover_gloves  # it loads the DLL
+
         lg.info('Opening dataglove')
         self.glove = []
+        if self.P['DATAGLOVE_CAPTURE']['DLL'] is not None:
+            FiveDTGlove.load_library(Path(self.P['DATAGLOVE_CAPTURE']['DLL']))
         if FiveDTGlove.gloveDLL is None:  # could not initialize DLL
             return
 
-        for i in range(2):  # TODO: we should use scan_USB but I get error
-            logname = self.P['logname']
-            DATAGLOVE_LOG = logname.parent / (logname.stem + f'_dataglove{i}.txt')
-            new_glove = FiveDTGlove(DATAGLOVE_LOG)
+        logname = self.P['logname']
+        for i, new_glove in enumerate(discover_gloves()):
+            glove_file = logname.parent / (logname.stem + f'_dataglove{i}.bin')
             try:
-                new_glove.open(f'USB{i}'.encode())
-            except IOError:
-                pass
+                recorder = GloveRecorder(
+                    new_glove, glove_file, t_zero=self.frame_timer.t_zero,
+                    mode=self.P['DATAGLOVE_CAPTURE']['MODE'],
+                    sensors=self.P['DATAGLOVE_CAPTURE']['SENSORS'],
+                    scaled=self.P['DATAGLOVE_CAPTURE']['SCALED'])
+            except ValueError as err:
+                lg.warning(f'Cannot record dataglove: {err}')
+                new_glove.close()
             else:
-                self.glove.append(new_glove)
+                self.glove.append(recorder)
+
+        # all the gloves start together, with the same clock (perf_counter_ns)
+        for recorder in self.glove:
+            recorder.start()
 
     def open_serial(self):
+        """This is called by the TriggerWriter, in its own thread"""
         try:
-            self.port_trigger = Serial(
+            return serial_for_url(
                 self.P['COM']['TRIGGER']['PORT'],
                 baudrate=self.P['COM']['TRIGGER']['BAUDRATE'])
         except SerialException:
             lg.warning('could not open serial port for triggers')
-            _warn_about_ports()
+            if not self.warned_about_ports:
+                _warn_about_ports()
+                self.warned_about_ports = True
 
     def serial(self, trigger):
         """trigger needs to be between 0 and 255. If none, then it closes the
-        serial port"""
+        serial port. The trigger is written by the TriggerWriter, so this
+        function never waits for the serial port."""
         if trigger is None:
-            if self.port_trigger is not None:
-                self.port_trigger.close()
+            self.trigger_writer.close()
         else:
             lg.debug(f'Sending trigger {trigger:03d}')
-            if self.port_trigger is not None:
-                try:
-                    self.port_trigger.write(pack('>B', trigger))
-                except Exception:
-                    lg.warning('could not write to serial port')
-                    self.open_serial()
+            self.trigger_writer.write(trigger)
+            self.events.write('trigger', trigger)
+
+    def initializeGL(self):
+        if self.P['RENDERER'] == 'opengl':
+            self.renderer = TextureRenderer(self.context())
+            self.upload_textures()
+
+    def resizeGL(self, width, height):
+        """Scale the images only when the size of the window changes (also
+        when switching to / from fullscreen). They are scaled in the
+        background, so that the onsets are not delayed."""
+        window_rect = self.rect()
+        self.img_center = (
+            window_rect.center().x() + self.P['SCREEN']['RIGHTWARDS'],
+            window_rect.center().y() + self.P['SCREEN']['DOWNWARDS'],
+            )
+        if self.renderer is None:
+            self.images.set_size(window_rect.size())
+            if self.images.pending and not self.loading_timer.isActive():
+                self.loading_timer.start(LOADING_INTERVAL)
+        else:
+            self.renderer.resize(window_rect.width(), window_rect.height(), self.img_center)
+
+    def upload_textures(self):
+        """Upload the images in the cache as textures, and delete the textures
+        of the images that are not in the cache anymore"""
+        for img_file, pixmap in self.images.pixmaps.items():
+            if img_file not in self.renderer:
+                self.renderer.upload(img_file, pixmap)
+        self.renderer.release([
+            k for k in self.renderer.textures
+            if isinstance(k, Path) and k not in self.images])
 
     def paintGL(self):
 
-        window_rect = self.rect()
-        rect_x = window_rect.center().x() + self.P['SCREEN']['RIGHTWARDS']
-        rect_y = window_rect.center().y() + self.P['SCREEN']['DOWNWARDS']
+        if self.renderer is None:
+            qp = QPainter()
+            qp.begin(self)
+            self.paint(qp)
+            qp.end()
+        else:
+            self.renderer.begin(self.bg_color)
+            self.paint(None)
+            self.renderer.end()
 
-        qp = QPainter()
-        qp.begin(self)
+        self.presented()
 
-        qp.fillRect(window_rect, self.bg_color)
+    def paint(self, qp):
+        """Draw the current stimulus, with QPainter (qp) or with the OpenGL
+        renderer (if qp is None)"""
+        if qp is not None:
+            qp.fillRect(self.rect(), self.bg_color)
 
         if self.paused:
             self.draw_text(qp, 'PAUSED')
 
         elif self.current_index is None:
             self.draw_text(qp, 'READY')
+            if self.images.pending:
+                self.draw_progress(qp)
 
         else:
 
-            if self.fast_tsv is not None:
-                i_pixmap = where(self.fast_tsv['onset'] <= self.fast_i)[0][-1]
-
-                if self.fast_i == self.fast_tsv['onset'][-1]:
-                    self.fast_tsv = None
-                    self.fast_i = None
-                    self.frameSwapped.disconnect()
-
-                else:
-                    if self.fast_tsv['stim_file'][i_pixmap] is not None:
-                        current_pixmap = self.fast_tsv['stim_file'][i_pixmap]
-                        image_rect = current_pixmap.rect()
-                        size = image_rect.size().scaled(window_rect.size(), Qt.KeepAspectRatio)
-                        img_origin_x = rect_x - int(size.width() / 2)
-                        img_origin_y = rect_y - int(size.height() / 2)
-
-                        qp.beginNativePainting()
-                        qp.drawPixmap(
-                            img_origin_x,
-                            img_origin_y,
-                            size.width(),
-                            size.height(),
-                            current_pixmap)
-                        qp.endNativePainting()
-
-                    lg.debug(f'FAST IMAGE #{self.fast_i}')
-                    self.fast_i += 1
+            if self.fast is not None and self.fast.finished:
+                self.stop_fast()
 
-            else:
+            if self.fast is None:
                 current_pixmap = self.stimuli['stim_file'][self.current_index]
-                if isinstance(current_pixmap, Path):
-                    self.fast_tsv = read_fast_stimuli(current_pixmap)
-                    self.fast_i = 0
+                if isinstance(current_pixmap, FastSequence):
+                    if self.fast_index == self.current_index:
+                        current_pixmap = ''  # the fast sequence was already presented
+                    else:
+                        self.fast_index = self.current_index
+                        self.start_fast(current_pixmap)
+
+            if self.fast is not None:
+                img_file = self.fast.current
+                if img_file is not None:
+                    self.draw_image(qp, img_file)
+                lg.debug(f'FAST IMAGE #{self.fast.i_frame}')
 
-                elif isinstance(current_pixmap, str):
+            else:
+                if isinstance(current_pixmap, str):
                     self.draw_text(qp, current_pixmap)
                     if current_pixmap == 'END':
                         if not self.finished:
@@ -234,59 +326,146 @@ class PrettyWidget(QOpenGLWidget):
                                 self.sound['end'].play()
 
                 else:
-                    image_rect = current_pixmap.rect()
-
-                    size = image_rect.size().scaled(window_rect.size(), Qt.KeepAspectRatio)
-                    img_origin_x = rect_x - int(size.width() / 2)
-                    img_origin_y = rect_y - int(size.height() / 2)
-                    qp.drawPixmap(
-                        img_origin_x,
-                        img_origin_y,
-                        size.width(),
-                        size.height(),
-                        current_pixmap)
+                    self.draw_image(qp, current_pixmap)
 
                 self.drawText(qp)
 
-        qp.end()
+    def presented(self):
+        """Send triggers and log info right after the image was presented"""
+        if self.t_ready is None and self.current_index is None:
+            self.t_ready = perf_counter_ns()
+            lg.info(f'Startup: READY after {(self.t_ready - T_LAUNCH) / 1e6:.0f} ms')
 
-        if self.presenting is not None:  # send triggers and log info right after the image was presented
+        if self.presenting is not None:
             trial = self.stimuli[self.presenting]
             lg.info('Presenting ' + str(trial['trial_name']))
+            self.events.write('present', trial['trial_type'], self.presenting)
             self.serial(trial['trial_type'])
+            self.prefetch(self.presenting)
+            self.unpin_first_images(self.presenting)
+            self.frame_trial = self.presenting
             self.presenting = None
 
-        if self.fast_i == 0:
-            self.input_thread.msleep(1000)
-            self.frameSwapped.connect(self.update)
+    def record_frame(self):
+        """Time of the buffer swap, which is the closest we get to the time
+        when the frame is on the screen"""
+        t_swap = perf_counter_ns()
+        if self.frame_timer.frame_period is None:
+            refresh_rate = self.window().windowHandle().screen().refreshRate()
+            self.frame_timer.frame_period = 1e9 / refresh_rate
+
+        if self.fast is None:
+            fast_frame = -1
+            # with polling, the widget is painted again at every tick
+            continuous = self.P['SCHEDULER']['MODE'] == 'polling'
+        else:
+            fast_frame = self.fast.i_frame
+            continuous = True
+        continuous = continuous and self.started and not self.paused
+
+        self.frame_timer.swapped(t_swap, self.frame_trial, fast_frame, continuous)
+        self.frame_trial = -1
+
+    def start_fast(self, fast):
+        refresh_rate = self.window().windowHandle().screen().refreshRate()
+        lg.debug(f'Starting fast sequence at {refresh_rate:.2f} Hz')
+        self.fast = fast
+        self.fast.start(refresh_rate)
+        self.frameSwapped.connect(self.swap_fast)
+
+    def swap_fast(self):
+        self.fast.swapped(self.frame_timer.t_last)
+        self.update()
+
+    def stop_fast(self):
+        self.frameSwapped.disconnect(self.swap_fast)
+        self.fast = None
+
+    def prefetch(self, index):
+        """Decode the next images after the one at index, if they are not in
+        the cache yet"""
+        if self.P['CACHE']['MEMORY'] is None:
+            return
+        i = bisect_right(self.i_images, index)
+        next_images = self.i_images[i:i + self.P['CACHE']['PREFETCH']]
+        self.images.prefetch(self.stimuli['stim_file'][next_images])
+        if self.images.pending and not self.loading_timer.isActive():
+            self.loading_timer.start(LOADING_INTERVAL)
+
+    def unpin_first_images(self, index):
+        """The first images that were presented for the last time (also if
+        some trials were skipped) can be dropped from the cache"""
+        done = [i for i in self.unpin_after if i <= index]
+        if done:
+            self.images.unpin([self.unpin_after.pop(i) for i in done])
+
+    def collect_images(self):
+        n_pending = self.images.collect()
+        if self.renderer is not None:
+            self.makeCurrent()
+            self.upload_textures()
+            self.doneCurrent()
+        if n_pending == 0:
+            self.loading_timer.stop()
+            if not self.started:
+                lg.info(f'Reading images: finished ({self.images.n_collected} images)')
+
+        if self.current_index is None:  # show progress
             self.update()
 
+    def draw_image(self, qp, img_file):
+
+        if qp is None:
+            if img_file not in self.renderer:
+                self.renderer.upload(img_file, self.images[img_file])
+            self.renderer.draw_image(img_file)
+
+        else:
+            pixmap = self.images.scaled(img_file)
+            qp.drawPixmap(
+                self.img_center[0] - pixmap.width() // 2,
+                self.img_center[1] - pixmap.height() // 2,
+                pixmap)
+
     def drawText(self, qp):
 
         if not self.P['FIXATION']['ACTIVE']:
             return
 
-        elapsed = self.time.elapsed() + self.delay
-        if elapsed > self.cross_delay:
-            if self.cross_color == 'green':
-                self.cross_color = 'red'
-                self.serial(240)
-            else:
-                self.cross_color = 'green'
-                self.serial(241)
-            self.cross_delay += random() * 5000 + 2000
-
         color = QColor(self.cross_color)
+        font = QFont('SansSerif', 50)
+        if qp is None:
+            self.renderer.draw_text('+', color, font)
+            return
+
         qp.setPen(color)
-        qp.setFont(QFont('SansSerif', 50))
+        qp.setFont(font)
         qp.drawText(*self.center_rect(), Qt.AlignCenter, '+')
 
     def draw_text(self, qp, text):
 
-        qp.setPen(QColor(40, 40, 255))
-        qp.setFont(QFont('Decorative', 50))
+        color = QColor(40, 40, 255)
+        font = QFont('Decorative', 50)
+        if qp is None:
+            self.renderer.draw_text(text, color, font)
+            return
+
+        qp.setPen(color)
+        qp.setFont(font)
         qp.drawText(*self.center_rect(), Qt.AlignCenter, text)
 
+    def draw_progress(self, qp):
+
+        if qp is None:  # not with the OpenGL renderer, the text changes too often
+            return
+
+        qp.setPen(QColor(40, 40, 255))
+        qp.setFont(QFont('Decorative', 20))
+        qp.drawText(
+            *self.center_rect(),
+            Qt.AlignHCenter | Qt.AlignBottom,
+            f'loading images {self.images.n_collected} / {self.images.n_requested}')
+
     def center_rect(self):
         window_rect = self.rect()
         width = window_rect.width()
@@ -300,51 +479,93 @@ class PrettyWidget(QOpenGLWidget):
 
         elapsed = self.time.elapsed() + self.delay
 
-        if self.P['DATAGLOVE']:
-            for glove in self.glove:
-                if glove.new_data:
-                    glove_data = glove.get_sensor_raw_all()
-                    glove.f.write(datetime.now().strftime('%H:%M:%S.%f') + '\t' + '\t'.join([f'{x}' for x in glove_data]) + '\n')
-
-        index_image = where((self.stimuli['onset'] * 1e3) <= elapsed)[0]
-        if len(index_image) == len(self.stimuli):
+        index_image = self.cursor.advance(elapsed)
+        if self.cursor.finished:
             self.stop()
+            return
 
-        elif len(index_image) > 0:
-            index_image = index_image[-1]
+        changed = False
+        if index_image >= 0 and index_image != self.current_index:
+            self.current_index = index_image
+            self.presenting = index_image
+            changed = True
 
-            if index_image != self.current_index:
-                self.current_index = index_image
+        if self.P['FIXATION']['ACTIVE'] and elapsed > self.cross_delay:
+            if self.cross_color == 'green':
+                self.cross_color = 'red'
+                self.serial(240)
+            else:
+                self.cross_color = 'green'
+                self.serial(241)
+            self.cross_delay += random() * 5000 + 2000
+            changed = True
 
-                if index_image is not None:
-                    self.presenting = index_image
+        if self.P['SCHEDULER']['MODE'] == 'onset':
+            if changed:
+                self.update()
+            self.arm_timer(elapsed)
+        else:
+            self.update()
 
-        self.update()
+    def arm_timer(self, elapsed):
+        """Wake up shortly before the next onset or the next change in
+        fixation color, then busy-wait until it's time (only with SCHEDULER
+        MODE "onset")"""
+        self.next_event = self.find_next_event()
+        interval = int(self.next_event - elapsed) - self.P['SCHEDULER']['BUSY_WAIT']
+        self.timer.start(max(interval, 0))
+
+    def find_next_event(self):
+        """Time (in ms) of the next onset or of the next change in fixation
+        color"""
+        next_event = self.cursor.next_onset
+        if self.P['FIXATION']['ACTIVE']:
+            next_event = min(next_event, int(self.cross_delay) + 1)
+        return next_event
+
+    def wait_for_onset(self):
+        while self.time.elapsed() + self.delay < self.next_event:
+            pass
+        self.check_time()
+
+    def start_timer(self):
+        if self.P['SCHEDULER']['MODE'] == 'onset':
+            self.check_time()
+        else:
+            self.timer.start(self.P['QTIMER_INTERVAL'])
 
     def start(self):
         if self.started:
             return
 
+        self.images.collect()
+        if not self.images.is_resident(self.first_images):
+            lg.warning(f'Cannot start: the images of the first {self.P["CACHE"]["PRELOAD"]} s are still loading')
+            return
+
         lg.warning('Starting')
         self.started = True
         self.current_index = -1
         self.time.start()
-        self.timer.start(self.P['QTIMER_INTERVAL'])
+        self.t_start = perf_counter_ns()
+        self.events.write('start', t=self.t_start)
+        self.start_timer()
         if self.sound['start'] is not None:
             self.sound['start'].play()
 
     def start_serial_input(self):
-        self.input_worker = SerialInputWorker()
-        self.input_worker.port_input = self.port_input
+        self.input_worker = SerialInputWorker(self.port_input)
         self.input_thread = QThread(parent=self)
         self.input_thread.started.connect(self.input_worker.start_reading)
         self.input_worker.signal_to_main.connect(self.read_serial_input)
         self.input_worker.moveToThread(self.input_thread)
         self.input_thread.start()
-        self.input_thread.setPriority(QThread.LowestPriority)
+        self.input_thread.setPriority(QThread.HighestPriority)
 
-    def read_serial_input(self, number):
+    def read_serial_input(self, number, t_read):
+        self.events.write('input', number, t=t_read)
         lg.info(f'Received input trigger {number}')
+        lg.debug(f'Input trigger {number} was read {(perf_counter_ns() - t_read) / 1e3:.0f} us ago')
 
         if self.P['COM']['INPUT']['START_TRIGGER'] == number:
             self.start()
@@ -353,13 +574,25 @@ class PrettyWidget(QOpenGLWidget):
 
     def stop(self):
         lg.info('Stopping task')
+        self.events.write('stop')
 
         if self.timer is not None:
             self.timer.stop()
-
-        # nice wayt to stop the worker
-        self.input_worker.running = False
-        self.input_thread.terminate()
+        self.loading_timer.stop()
+        self.images.close()
+        self.frame_timer.close()
+        self.trigger_writer.close()
+        self.trigger_writer.join(timeout=1)
+        self.events.close()
+
+        self.input_worker.stop()
+        self.input_thread.quit()
+        self.input_thread.wait()
+
+        for recorder in self.glove:
+            recorder.stop()
+            recorder.join(timeout=1)
+            recorder.glove.close()
 
         sleep(1)
         app.exit(0)
@@ -369,15 +602,17 @@ class PrettyWidget(QOpenGLWidget):
             self.paused = True
             self.delay += self.time.elapsed()
             self.timer.stop()
+            self.events.write('pause')
             self.serial(253)
             lg.info('Pausing the task')
 
         else:
             self.paused = False
             self.time.restart()
+            self.events.write('resume')
             self.serial(254)
             lg.info('Pause finished: restarting the task')
-            self.timer.start(self.P['QTIMER_INTERVAL'])
+            self.start_timer()
         self.update()
 
     def keyPressEvent(self, event):
@@ -427,23 +662,9 @@ class PrettyWidget(QOpenGLWidget):
         event.accept()
 
 
-class SerialInputWorker(QObject):
-    signal_to_main = pyqtSignal(int)
-    running = True
-
-    def __init__(self):
-        super().__init__()
-
-    @pyqtSlot()
-    def start_reading(self):
-        while self.running:
-            if self.port_input is not None:
-                serial_input = self.port_input.read()
-                if serial_input != b'' and serial_input != b'\x00':
-                    self.signal_to_main.emit(unpack('>B', serial_input)[0])
-
-
 def _warn_about_ports():
+    from serial.tools.list_ports import comports
+
     port_names = sorted([x.device for x in comports()])
     if len(port_names) > 0:
         ports = ', '.join(port_names)
@@ -454,33 +675,35 @@ def _warn_about_ports():
 
 def main():
 
+    tasks = sorted([x.stem for x in TASKS_DIR.iterdir()])
+    configurations = sorted([x.stem for x in CONFIG_DIR.glob('*.json')])
+
     parser = ArgumentParser(prog='presentation')
     parser.add_argument(
         'task',
         nargs='?',
-        help='one of [{}]'.format(', '.join(TASKS)))
+        help='one of [{}]'.format(', '.join(tasks)))
     parser.add_argument(
         'configuration',
         nargs='?',
         default=None,
-        help='empty or one of [{}]'.format(', '.join(CONFIGURATIONS)))
+        help='empty or one of [{}]'.format(', '.join(configurations)))
+    parser.add_argument(
+        '--tsv',
+        help='timing TSV in the task folder, instead of TASK_TSV')
+    parser.add_argument(
+        '--simulate',
+        action='store_true',
+        help='run the whole task on a virtual clock, without showing it, and '
+        'write the timeline of triggers and stimuli')
     args = parser.parse_args()
     print(args)
 
-    with DEFAULTS_JSON.open() as f:
-        PARAMETERS = load(f)
-
     task_dir = TASKS_DIR / args.task
-    parameter_json = task_dir / 'parameters.json'
-    with parameter_json.open() as f:
-        CHANGES = load(f)
-    PARAMETERS = update(PARAMETERS, CHANGES)
+    PARAMETERS = read_parameters(args.task, args.configuration)
 
-    if args.configuration is not None:
-        parameter_json = CONFIG_DIR / f'{args.configuration}.json'
-        with parameter_json.open() as f:
-            CHANGES = load(f)
-        PARAMETERS = update(PARAMETERS, CHANGES)
+    if args.tsv is not None:
+        PARAMETERS['TASK_TSV'] = args.tsv
 
     PARAMETERS['task'] = args.task
     PARAMETERS['configuration'] = args.configuration
@@ -488,18 +711,16 @@ def main():
     now = datetime.now()
     logname = LOG_DIR / f'log_{now:%Y%m%d_%H%M%S}.txt'
 
-    logging.basicConfig(
-        filename=logname,
-        filemode='w',
-        format='%(asctime)s.%(msecs)03d\t%(name)s\t%(levelname)s\t%(message)s',
-        datefmt='%H:%M:%S',
-        level=logging.DEBUG)
+    log_listener = start_logging(logname)
     logging.info(str(now))
     PARAMETERS['logname'] = logname
 
-    if Process is not None:
-        ps = Process()
-        ps.nice(HIGH_PRIORITY_CLASS)
+    try:
+        from psutil import Process, HIGH_PRIORITY_CLASS  # only windows
+    except ImportError:
+        pass
+    else:
+        Process().nice(HIGH_PRIORITY_CLASS)
 
     task_tsv = (task_dir / PARAMETERS['TASK_TSV']).resolve()
     if task_tsv.exists():
@@ -509,8 +730,22 @@ def main():
         PARAMETERS['TASK_TSV'] = (task_dir / 'timing.tsv').resolve()
 
     lg.debug(pformat(PARAMETERS))
-    w = PrettyWidget(PARAMETERS)
-    app.exec()
+    try:
+        if args.simulate:
+            from .simulate import simulate
+
+            timeline_tsv = logname.with_name(logname.stem + '_timeline.tsv')
+            summary = simulate(PARAMETERS, timeline_tsv)
+            print(pformat(summary))
+            print(f'Timeline saved to {timeline_tsv}')
+
+        else:
+            start_app()
+            w = PrettyWidget(PARAMETERS)
+            app.exec()
+
+    finally:
+        stop_logging(log_listener)
 
 
 if __name__ == '__main__':
@@ -1,18 +1,90 @@
+from logging import getLogger
+
 from numpy import (
-    append,
     atleast_1d,
-    array,
-    dtype,
-    empty,
+    concatenate,
+    flatnonzero,
     genfromtxt,
-    squeeze,
+    insert,
+    ones,
+    unique,
+    zeros,
     )
-from PyQt5.QtGui import QPixmap
+
+from .fast import FastSequence
+from .schedule import load_schedule, save_schedule
+
+lg = getLogger('qttask')
 
 
 def read_stimuli(P):
+    """Read the timing TSV of the task.
 
+    Images are not decoded here, stim_file only contains their path (see
+    PixmapCache). Fast sequences (.tsv) are read here, only once for each file,
+    and stim_file contains a FastSequence.
+    """
     task_dir = P['TASK_TSV'].parent
+    tsv = read_schedule(P)
+
+    d_images = {}
+    for img in set(tsv['stim_file']):
+        if img.endswith('.png') or img.endswith('.jpg'):
+            img_file = task_dir / img
+            if not img_file.exists():
+                print(f'{img_file} does not exist')
+            d_images[img] = img_file
+
+    d_fast = {}
+    for fast_tsv in set(tsv['stim_file']):
+        if fast_tsv.endswith('.tsv'):
+            d_fast[fast_tsv] = FastSequence(read_fast_stimuli(task_dir / fast_tsv))
+
+    for i in range(tsv['stim_file'].shape[0]):
+        if tsv['stim_file'][i].endswith('.png') or tsv['stim_file'][i].endswith('.jpg'):
+            tsv['stim_file'][i] = d_images[tsv['stim_file'][i]]
+
+        elif tsv['stim_file'][i].endswith('.tsv'):
+            tsv['stim_file'][i] = d_fast[tsv['stim_file'][i]]
+
+    return tsv
+
+
+def read_schedule(P):
+    """Read the timing TSV, with the baseline periods and the end. If
+    SCHEDULE_CACHE, use the compiled schedule (if it's up to date) or compile
+    it for the next time.
+
+    Returns
+    -------
+    ndarray
+        text columns (such as stim_file and trial_name) are str objects
+    """
+    if not P['SCHEDULE_CACHE']:
+        return _read_timing(P)
+
+    schedule_file = _schedule_file(P['TASK_TSV'])
+    key = {
+        'BASELINE': P['BASELINE'],
+        'OUTRO': P['OUTRO'],
+        }
+    tsv = load_schedule(schedule_file, P['TASK_TSV'], key)
+    if tsv is None:
+        lg.debug(f'Compiling schedule {schedule_file}')
+        tsv = _read_timing(P)
+        try:
+            save_schedule(tsv, schedule_file, P['TASK_TSV'], key)
+        except OSError as err:
+            lg.warning(f'Could not save compiled schedule: {err}')
+
+    return tsv
+
+
+def _schedule_file(task_tsv):
+    return task_tsv.parent / 'compiled' / (task_tsv.stem + '.npy')
+
+
+def _read_timing(P):
 
     tsv = genfromtxt(
         fname=str(P['TASK_TSV']),
@@ -23,72 +95,46 @@ def read_stimuli(P):
         encoding='utf-8')
     tsv = atleast_1d(tsv)
 
-    # make sure that that text are long enough to keep many chars
+    # text is stored as str objects, so that the length is not limited
     dtypes = []
     for n in tsv.dtype.names:
         if n in ('onset', 'duration'):
             dtypes.append((n, '<f8'))  # make sure they are float
         elif tsv.dtype[n].kind == 'U':
-            dtypes.append((n, 'U4096'))
+            dtypes.append((n, 'O'))
         else:
             dtypes.append((n, tsv.dtype[n]))
+    tsv = _intern(tsv.astype(dtypes))
 
-    tsv = array(tsv, dtype=dtype(dtypes))
-
-    x = empty((2, ), dtype=tsv.dtype)
+    x = _empty_rows(2, tsv.dtype)
     x['onset'][0] = tsv['onset'][-1] + tsv['duration'][-1] + P['OUTRO']
     x['duration'][0] = 1
     x['stim_file'][0] = 'END'
     x['trial_type'][0] = 251
     x['onset'][1] = x['onset'][0] + x['duration'][0]
-    tsv = append(tsv, x)
-
-    out_tsv = []
-
-    if tsv[0]['onset'] > 0:  # start with baseline
-        x = empty((1, ), dtype=tsv.dtype)
-        x['onset'] = 0
-        x['trial_name'] = 'BASELINE'
-        x['stim_file'] = P['BASELINE']
-        x['trial_type'] = 0
-        out_tsv.append(x)
-
-    for i in range(tsv.shape[0] - 1):
-        out_tsv.append(tsv[i:i + 1])
-        end_image = tsv[i]['onset'] + tsv[i]['duration']
-        next_image = tsv[i + 1]['onset']
-
-        if end_image < next_image:
-            x = empty((1, ), dtype=tsv.dtype)
-            x['onset'] = end_image
-            x['trial_name'] = 'BASELINE'
-            x['stim_file'] = P['BASELINE']
-            x['trial_type'] = 0
-            out_tsv.append(x)
-    out_tsv.append(tsv[-1:])
-    tsv = squeeze(array(out_tsv))
-
-    d_images = {}
-    for img in set(tsv['stim_file']):
-        if img.endswith('.png') or img.endswith('.jpg'):
-            img_file = task_dir / img
-            if not img_file.exists():
-                print(f'{img_file} does not exist')
-            d_images[img] = QPixmap(str(img_file))
+    tsv = concatenate((tsv, x))
 
-    tsv = _change_dtype_to_O(tsv)
+    # add baseline where there is a gap between one image and the next one
+    end_image = tsv['onset'][:-1] + tsv['duration'][:-1]
+    i_gap = flatnonzero(end_image < tsv['onset'][1:])
+    x = _empty_rows(i_gap.shape[0], tsv.dtype)
+    x['onset'] = end_image[i_gap]
+    i_gap += 1
 
-    for i in range(tsv['stim_file'].shape[0]):
-        if tsv['stim_file'][i].endswith('.png') or tsv['stim_file'][i].endswith('.jpg'):
-            tsv['stim_file'][i] = d_images[tsv['stim_file'][i]]
+    if tsv['onset'][0] > 0:  # start with baseline
+        x = concatenate((_empty_rows(1, tsv.dtype), x))
+        i_gap = concatenate(([0], i_gap))
 
-        elif tsv['stim_file'][i].endswith('.tsv'):
-            tsv['stim_file'][i] = task_dir / tsv['stim_file'][i]
+    x['trial_name'] = 'BASELINE'
+    x['stim_file'] = P['BASELINE']
+    x['trial_type'] = 0
 
-    return tsv
+    return insert(tsv, i_gap, x)
 
 
 def read_fast_stimuli(STIMULI_TSV):
+    """Read the table of a fast sequence. onset and duration are in frames,
+    stim_file contains the path of the images (None for blank frames)"""
     IMAGES_DIR = STIMULI_TSV.parent
 
     tsv = genfromtxt(
@@ -98,35 +144,40 @@ def read_fast_stimuli(STIMULI_TSV):
         dtype=None,  # forces it to read strings
         deletechars='',
         encoding='utf-8')
-    tsv = _change_dtype_to_O(tsv)
     tsv = atleast_1d(tsv)
+    tsv = tsv.astype([(k, 'O' if k == 'stim_file' else v) for k, v in tsv.dtype.descr])
+
+    # add a blank frame after the last image and after each gap
+    end_image = tsv['onset'] + tsv['duration']
+    is_gap = ones(tsv.shape[0], dtype=bool)
+    is_gap[:-1] = end_image[:-1] < tsv['onset'][1:]
+    i_gap = flatnonzero(is_gap)
+    x = zeros(i_gap.shape[0], dtype=tsv.dtype)
+    x['onset'] = end_image[i_gap]
+    x['stim_file'] = None
+    tsv = insert(tsv, i_gap + 1, x)
+
+    # one Path for each image
+    for png in set(tsv['stim_file']):
+        if png is not None:
+            tsv['stim_file'][tsv['stim_file'] == png] = IMAGES_DIR / png
 
-    out_tsv = []
-    for i in range(tsv.shape[0]):
-        out_tsv.append(tsv[i:i + 1])
-        end_image = tsv[i]['onset'] + tsv[i]['duration']
-        if (i == tsv.shape[0] - 1) or (end_image < tsv[i + 1]['onset']):
-            x = empty((1, ), dtype=tsv.dtype)
-            x['onset'] = end_image
-            x['stim_file'] = None
-            out_tsv.append(x)
-
-    tsv = squeeze(array(out_tsv))
+    return tsv
 
-    # read images only once
-    d_images = {png: QPixmap(str(IMAGES_DIR / png)) for png in set(tsv['stim_file']) if png is not None}
-    for png, pixmap in d_images.items():
-        tsv['stim_file'][tsv['stim_file'] == png] = pixmap
 
+def _intern(tsv):
+    """Each text column points to only one str object for each unique text
+    (like categorical data)"""
+    for n in tsv.dtype.names:
+        if tsv.dtype[n].kind == 'O':
+            values, codes = unique(tsv[n], return_inverse=True)
+            tsv[n] = values[codes]
     return tsv
 
 
-def _change_dtype_to_O(tsv, name='stim_file'):
-    # change dtype for stim_file only
-    dtypes = []
-    for k, v in tsv.dtype.descr:
-        if k == name:
-            v = 'O'
-        dtypes.append((k, v))
-    return tsv.astype(dtypes)
-
+def _empty_rows(n_rows, dtype):
+    x = zeros(n_rows, dtype=dtype)
+    for n in dtype.names:
+        if dtype[n].kind == 'O':
+            x[n] = ''
+    return x
@@ -0,0 +1,170 @@
+from logging import getLogger
+
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import (
+    QColor,
+    QFontMetrics,
+    QImage,
+    QOpenGLShader,
+    QOpenGLShaderProgram,
+    QOpenGLTexture,
+    QOpenGLVersionProfile,
+    QPainter,
+    QVector2D,
+    )
+
+lg = getLogger('qttask')
+
+GL_COLOR_BUFFER_BIT = 0x4000
+GL_TRIANGLE_STRIP = 0x0005
+GL_BLEND = 0x0BE2
+GL_SRC_ALPHA = 0x0302
+GL_ONE_MINUS_SRC_ALPHA = 0x0303
+GL_RENDERER = 0x1F01
+
+# Qt defines lowp / mediump / highp away on desktop OpenGL
+VERTEX_SHADER = """
+attribute highp vec2 position;
+uniform highp vec4 rect;
+varying highp vec2 texcoord;
+void main() {
+    gl_Position = vec4(rect.xy + position * rect.zw, 0.0, 1.0);
+    texcoord = position;
+}
+"""
+FRAGMENT_SHADER = """
+uniform lowp sampler2D texture;
+varying highp vec2 texcoord;
+void main() {
+    gl_FragColor = texture2D(texture, texcoord);
+}
+"""
+# unit square, also used as texture coordinates
+QUAD = [QVector2D(0, 0), QVector2D(1, 0), QVector2D(0, 1), QVector2D(1, 1)]
+
+
+class TextureRenderer:
+    """Draw the stimuli as textured quads, one draw call for each image.
+
+    The images are uploaded as textures once (upload). Texts (such as READY
+    or the fixation cross) are rendered into a texture the first time they
+    are used.
+
+    Parameters
+    ----------
+    context : QOpenGLContext
+        context of the widget (it needs to be current)
+    """
+    def __init__(self, context):
+        profile = QOpenGLVersionProfile()
+        profile.setVersion(2, 0)
+        self.gl = context.versionFunctions(profile)
+        self.gl.initializeOpenGLFunctions()
+
+        self.program = QOpenGLShaderProgram()
+        self.program.addShaderFromSourceCode(QOpenGLShader.Vertex, VERTEX_SHADER)
+        self.program.addShaderFromSourceCode(QOpenGLShader.Fragment, FRAGMENT_SHADER)
+        if not self.program.link():
+            raise RuntimeError('Could not link shaders: ' + self.program.log())
+        self.loc_position = self.program.attributeLocation('position')
+        self.loc_rect = self.program.uniformLocation('rect')
+        self.loc_texture = self.program.uniformLocation('texture')
+
+        self.textures = {}
+        self.rects = {}
+        self.width = 1
+        self.height = 1
+        self.center = (0, 0)
+
+        lg.info('OpenGL renderer: ' + self.gl.glGetString(GL_RENDERER))
+
+    def __contains__(self, key):
+        return key in self.textures
+
+    def upload(self, key, pixmap):
+        """Upload an image (QPixmap or QImage) as texture"""
+        if isinstance(pixmap, QImage):
+            image = pixmap
+        else:
+            image = pixmap.toImage()
+        # the first row of the texture is the bottom of the quad
+        texture = QOpenGLTexture(image.mirrored(), QOpenGLTexture.DontGenerateMipMaps)
+        texture.setMinMagFilters(QOpenGLTexture.Nearest, QOpenGLTexture.Nearest)
+        texture.setWrapMode(QOpenGLTexture.ClampToEdge)
+        self.textures[key] = texture, image.width(), image.height()
+
+    def release(self, keys):
+        """Delete textures that are not needed anymore"""
+        for key in keys:
+            texture = self.textures.pop(key)[0]
+            texture.destroy()
+            self.rects.pop(key, None)
+
+    def resize(self, width, height, center):
+        self.width = width
+        self.height = height
+        self.center = center
+        self.rects.clear()
+
+    def begin(self, bg_color):
+        """Clear the screen and prepare to draw the quads"""
+        self.gl.glClearColor(bg_color.redF(), bg_color.greenF(), bg_color.blueF(), 1)
+        self.gl.glClear(GL_COLOR_BUFFER_BIT)
+        self.gl.glEnable(GL_BLEND)
+        self.gl.glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        self.program.bind()
+        self.program.setUniformValue(self.loc_texture, 0)
+        self.program.enableAttributeArray(self.loc_position)
+        self.program.setAttributeArray(self.loc_position, QUAD)
+
+    def end(self):
+        self.program.disableAttributeArray(self.loc_position)
+        self.program.release()
+
+    def draw_image(self, key, scale=True):
+        """Draw the texture at the center of the screen. If scale, it fits the
+        window (keeping the aspect ratio), otherwise it keeps its size."""
+        try:
+            rect = self.rects[key]
+        except KeyError:
+            rect = self.rects[key] = self._compute_rect(key, scale)
+
+        self.textures[key][0].bind()
+        self.program.setUniformValue(self.loc_rect, *rect)
+        self.gl.glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+    def draw_text(self, text, color, font):
+        key = (text, QColor(color).name(), font.family(), font.pointSize())
+        if key not in self.textures:
+            self.upload(key, _render_text(text, color, font))
+        self.draw_image(key, scale=False)
+
+    def _compute_rect(self, key, scale):
+        """Position and size of the quad, in normalized device coordinates"""
+        _, width, height = self.textures[key]
+        if scale:
+            ratio = min(self.width / width, self.height / height)
+            width = int(width * ratio)
+            height = int(height * ratio)
+        x = self.center[0] - width // 2
+        y = self.center[1] + height - height // 2  # bottom of the image
+        return (
+            2 * x / self.width - 1,
+            1 - 2 * y / self.height,
+            2 * width / self.width,
+            2 * height / self.height,
+            )
+
+
+def _render_text(text, color, font):
+    rect = QFontMetrics(font).boundingRect(text)
+    image = QImage(rect.width(), rect.height(), QImage.Format_ARGB32_Premultiplied)
+    image.fill(Qt.transparent)
+    qp = QPainter()
+    qp.begin(image)
+    qp.setPen(QColor(color))
+    qp.setFont(font)
+    qp.drawText(image.rect(), Qt.AlignCenter, text)
+    qp.end()
+    return image
@@ -0,0 +1,156 @@
+from bisect import bisect_right
+from hashlib import sha1
+from json import dump, load
+
+from numpy import array, concatenate, empty, load as np_load, save, unique
+
+from .paths import write_atomic
+
+SCHEDULE_VERSION = 1
+
+
+class OnsetCursor:
+    """Find which stimulus should be on screen, given the elapsed time.
+
+    The onsets are converted to ms only once and the time can only move
+    forward, so at every tick we only need to look at the next onset.
+
+    Parameters
+    ----------
+    onsets : ndarray
+        onsets of the stimuli, in s, sorted
+    """
+    def __init__(self, onsets):
+        self.onsets_ms = [float(x) * 1e3 for x in onsets]
+        self.n_onsets = len(self.onsets_ms)
+        self.i_next = 0
+
+    def advance(self, elapsed):
+        """Move the cursor to the elapsed time (in ms).
+
+        Returns
+        -------
+        int
+            index of the last stimulus whose onset is before elapsed, -1 if
+            no stimulus has started yet
+        """
+        i = self.i_next
+        if i < self.n_onsets and self.onsets_ms[i] <= elapsed:
+            i = bisect_right(self.onsets_ms, elapsed, i)
+            self.i_next = i
+        return i - 1
+
+    @property
+    def finished(self):
+        return self.i_next == self.n_onsets
+
+    @property
+    def next_onset(self):
+        """onset (in ms) of the next stimulus, None at the end"""
+        if self.finished:
+            return None
+        return self.onsets_ms[self.i_next]
+
+
+def save_schedule(tsv, schedule_file, task_tsv, key):
+    """Save the schedule in a compact binary format: a .npy file with numbers
+    only (text columns contain the index of the text) and a .json file with
+    the text and the key.
+
+    Parameters
+    ----------
+    tsv : ndarray
+        schedule, text columns should be str objects
+    schedule_file : Path
+        .npy file to write
+    task_tsv : Path
+        timing TSV used to create the schedule
+    key : dict
+        parameters that were used to create the schedule
+    """
+    names = [n for n in tsv.dtype.names if tsv.dtype[n].kind == 'O']
+    strings, codes = unique(
+        concatenate([tsv[n].astype(str) for n in names]),
+        return_inverse=True)
+
+    compiled = empty(tsv.shape, dtype=[
+        (n, '<i4' if n in names else tsv.dtype[n]) for n in tsv.dtype.names])
+    for n in tsv.dtype.names:
+        if n in names:
+            i = names.index(n) * tsv.shape[0]
+            compiled[n] = codes[i:i + tsv.shape[0]]
+        else:
+            compiled[n] = tsv[n]
+
+    stat = task_tsv.stat()
+    header = {
+        'version': SCHEDULE_VERSION,
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha1': _hash(task_tsv),
+        'key': key,
+        'text_columns': names,
+        'strings': strings.tolist(),
+        }
+
+    # the header is written last, so that an interrupted write (or another
+    # launch reading at the same time) never pairs it with the wrong array
+    header_file = schedule_file.with_suffix('.json')
+    schedule_file.parent.mkdir(exist_ok=True)
+    if header_file.exists():
+        header_file.unlink()
+    write_atomic(schedule_file, 'wb', lambda f: save(f, compiled))
+    write_atomic(header_file, 'w', lambda f: dump(header, f))
+
+
+def load_schedule(schedule_file, task_tsv, key):
+    """Load the compiled schedule, if it is up to date.
+
+    Returns
+    -------
+    ndarray or None
+        schedule (with the text as str objects) or None if the schedule needs
+        to be compiled again
+    """
+    header_file = schedule_file.with_suffix('.json')
+    if not schedule_file.exists() or not header_file.exists():
+        return None
+
+    with header_file.open() as f:
+        header = load(f)
+
+    if header['version'] != SCHEDULE_VERSION or header['key'] != key:
+        return None
+
+    # check the content only if the file might have changed
+    stat = task_tsv.stat()
+    if stat.st_mtime_ns != header['mtime_ns'] or stat.st_size != header['size']:
+        if _hash(task_tsv) != header['sha1']:
+            return None
+        # same content, so the next launches don't need to hash it again
+        header['mtime_ns'] = stat.st_mtime_ns
+        header['size'] = stat.st_size
+        try:
+            write_atomic(header_file, 'w', lambda f: dump(header, f))
+        except OSError:
+            pass  # read-only folder, it's only slower
+
+    # every column is converted below, so a memory map would only add the
+    # page faults
+    compiled = np_load(schedule_file)
+    strings = array(header['strings'], dtype='O')
+    names = header['text_columns']
+
+    tsv = empty(compiled.shape, dtype=[
+        (n, 'O' if n in names else compiled.dtype[n]) for n in compiled.dtype.names])
+    for n in compiled.dtype.names:
+        if n in names:
+            tsv[n] = strings[compiled[n]]
+        else:
+            tsv[n] = compiled[n]
+
+    return tsv
+
+
+def _hash(task_tsv):
+    return sha1(task_tsv.read_bytes()).hexdigest()
@@ -0,0 +1,194 @@
+from concurrent.futures import wait
+from logging import getLogger
+from time import perf_counter
+
+from PyQt5.QtGui import QImage, QPainter
+
+from .presentation import PrettyWidget
+
+lg = getLogger('qttask')
+
+REFRESH_RATE = 60  # Hz, to present the fast sequences
+
+
+class VirtualClock:
+    """Replace QTime: the time moves forward only when it is set (in ms)"""
+    def __init__(self):
+        self.now = 0
+        self.t_start = 0
+
+    def start(self):
+        self.t_start = self.now
+
+    def restart(self):
+        elapsed = self.elapsed()
+        self.start()
+        return elapsed
+
+    def elapsed(self):
+        return self.now - self.t_start
+
+    def set_elapsed(self, elapsed):
+        self.now = self.t_start + elapsed
+
+
+class SimulatedWidget(PrettyWidget):
+    """Present the whole task on a virtual clock, as fast as possible.
+
+    Instead of waiting for the timers, the clock jumps to the next onset (or
+    to the next frame of a fast sequence). The widget is never shown: each
+    frame is painted into an image. The triggers and the stimuli that were
+    presented are stored in the timeline.
+
+    Parameters
+    ----------
+    parameters : dict
+        parameters of the task
+    refresh_rate : float
+        refresh rate (in Hz) used to present the fast sequences
+    """
+    def __init__(self, parameters, refresh_rate=REFRESH_RATE):
+        # PrettyWidget.__init__ already sends a trigger
+        self.clock = VirtualClock()
+        self.timeline = []  # time (ms), event, value, index of the trial
+        self.refresh_rate = refresh_rate
+        self.running = True
+        self.t_swap = None
+        self.n_frames = 0
+
+        super().__init__(parameters)
+        self.time = self.clock
+        self.frame = QImage(self.size(), QImage.Format_RGB32)
+        self.resizeGL(self.width(), self.height())
+
+    def show(self):
+        pass
+
+    def showFullScreen(self):
+        pass
+
+    def showNormal(self):
+        pass
+
+    def update(self):
+        """Paint the frame right away, into the image"""
+        if self.presenting is not None:
+            self.record('present', self.stimuli['trial_type'][self.presenting], self.presenting)
+        qp = QPainter()
+        qp.begin(self.frame)
+        self.paint(qp)
+        qp.end()
+        self.n_frames += 1
+        self.presented()
+
+    def serial(self, trigger):
+        if trigger is not None:
+            self.record('trigger', trigger)
+        super().serial(trigger)
+
+    def record(self, event, value, index=-1):
+        self.timeline.append((self.clock.elapsed(), event, int(value), index))
+
+    def start_fast(self, fast):
+        self.fast = fast
+        self.fast.start(self.refresh_rate)
+        self.t_swap = self.clock.elapsed()  # the first frame is swapped now
+
+    def swap_fast(self):
+        self.fast.swapped(int(self.clock.elapsed() * 1e6))
+        self.t_swap += 1e3 / self.refresh_rate
+        self.update()
+
+    def stop_fast(self):
+        self.fast = None
+
+    def start_timer(self):
+        """The clock is moved by run"""
+        pass
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        """Present the whole task, then close the ports"""
+        wait(list(self.images.pending.values()))
+        self.images.collect()
+        self.start()
+
+        while self.running:
+            next_event = self.find_next_event()
+            if self.fast is not None and self.t_swap <= next_event:
+                self.clock.set_elapsed(self.t_swap)
+                self.swap_fast()
+            else:
+                self.clock.set_elapsed(next_event)
+                self.check_time()
+
+        super().stop()
+
+
+def simulate(parameters, timeline_tsv):
+    """Run the task on a virtual clock and write the timeline.
+
+    Parameters
+    ----------
+    parameters : dict
+        parameters of the task. The serial ports, the sound and the dataglove
+        are not used.
+    timeline_tsv : Path
+        file to write the triggers and the stimuli that were presented
+
+    Returns
+    -------
+    dict
+        summary of the comparison between the timeline and the schedule
+    """
+    P = parameters
+    P['COM']['TRIGGER']['PORT'] = 'loop://'
+    P['COM']['INPUT']['PORT'] = 'loop://'
+    P['SOUND']['PLAY'] = False
+    P['DATAGLOVE'] = False
+    P['RENDERER'] = 'qpainter'
+
+    t0 = perf_counter()
+    w = SimulatedWidget(P)
+    w.run()
+    lg.info(f'Simulation took {perf_counter() - t0:.3f} s ({w.n_frames} frames)')
+
+    write_timeline(w.timeline, w.stimuli, timeline_tsv)
+    return check_timeline(w.timeline, w.stimuli)
+
+
+def write_timeline(timeline, stimuli, timeline_tsv):
+    with timeline_tsv.open('w') as f:
+        f.write('onset\tevent\tvalue\ttrial\ttrial_name\n')
+        for t, event, value, index in timeline:
+            if index == -1:
+                trial, trial_name = 'n/a', 'n/a'
+            else:
+                trial, trial_name = index, stimuli['trial_name'][index]
+            f.write(f'{t / 1e3:.6f}\t{event}\t{value}\t{trial}\t{trial_name}\n')
+
+
+def check_timeline(timeline, stimuli):
+    """Compare the stimuli that were presented with the schedule. All the
+    stimuli should be presented, apart from the last row (the end of the
+    task)."""
+    presented = {index: t for t, event, value, index in timeline if event == 'present'}
+    missing = [i for i in range(stimuli.shape[0] - 1) if i not in presented]
+    onset_error = [abs(t - stimuli['onset'][i] * 1e3) for i, t in presented.items()]
+
+    summary = {
+        'n_stimuli': stimuli.shape[0] - 1,
+        'n_presented': len(presented),
+        'n_triggers': sum(1 for x in timeline if x[1] == 'trigger'),
+        'missing': missing,
+        'max_onset_error': float(max(onset_error, default=0)),  # ms
+        'duration': timeline[-1][0] / 1e3,  # s
+        }
+
+    lg.info(f'Presented {summary["n_presented"]} / {summary["n_stimuli"]} stimuli, '
+            f'max onset error {summary["max_onset_error"]:.3f} ms')
+    if missing:
+        lg.warning(f'Stimuli that were not presented: {missing}')
+    return summary
@@ -0,0 +1,144 @@
+from logging import getLogger
+from queue import SimpleQueue
+from struct import pack
+from threading import Event, Thread
+from time import monotonic, perf_counter_ns
+
+from numpy import array, percentile
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+
+lg = getLogger('qttask')
+
+PERCENTILES = (50, 95, 99, 100)
+RETRY_INTERVAL = 5  # s, between attempts to open the port again
+
+
+class TriggerWriter(Thread):
+    """Write the triggers to the serial port in a separate thread, so that the
+    main thread never waits for the serial port.
+
+    The triggers are put in a queue with the time when they were sent (write)
+    and the time when they were written to the serial port is recorded as
+    well. If writing fails, the port is opened again in this thread, at most
+    once every retry_interval s (the triggers in the meantime are dropped).
+
+    Parameters
+    ----------
+    open_port : function
+        function that opens the serial port and returns it (or None if it
+        could not be opened)
+    retry_interval : float
+        minimum time (in s) between the attempts to open the port
+    """
+    def __init__(self, open_port, retry_interval=RETRY_INTERVAL):
+        super().__init__(daemon=True)
+        self.open_port = open_port
+        self.retry_interval = retry_interval
+        self.t_open = None  # monotonic, last attempt to open the port
+        self.port = None
+        self.queue = SimpleQueue()
+        self.timestamps = []  # trigger, time in queue, time written (in ns)
+
+    def write(self, trigger):
+        """trigger needs to be between 0 and 255"""
+        self.queue.put((trigger, perf_counter_ns()))
+
+    def close(self):
+        """Write the remaining triggers and close the port (it does not wait,
+        use join for that)"""
+        self.queue.put(None)
+
+    def reopen(self):
+        """Open the port, unless the last attempt was less than retry_interval
+        s ago"""
+        t = monotonic()
+        if self.t_open is not None and t - self.t_open < self.retry_interval:
+            return
+        self.t_open = t
+        self.port = self.open_port()
+
+    def run(self):
+        self.reopen()
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            trigger, t_queue = item
+
+            if self.port is None:
+                self.reopen()
+            if self.port is None:
+                continue
+
+            try:
+                self.port.write(pack('>B', trigger))
+            except Exception:
+                lg.warning('could not write to serial port')
+                try:
+                    self.port.close()
+                except Exception:
+                    pass
+                self.port = None
+                self.reopen()
+            else:
+                self.timestamps.append((trigger, t_queue, perf_counter_ns()))
+
+        if self.port is not None:
+            self.port.close()
+        self.log_latency()
+
+    @property
+    def latency(self):
+        """time between sending the trigger and writing it to the port, in ns"""
+        timestamps = array(self.timestamps, dtype='int64').reshape(-1, 3)
+        return timestamps[:, 2] - timestamps[:, 1]
+
+    def log_latency(self):
+        latency = self.latency
+        if latency.shape[0] == 0:
+            return
+        values = percentile(latency / 1e3, PERCENTILES)
+        stats = ', '.join(f'{p}%: {v:.0f}' for p, v in zip(PERCENTILES, values))
+        lg.info(f'Trigger latency in us ({latency.shape[0]} triggers) {stats}')
+
+
+class SerialInputWorker(QObject):
+    """Read the input triggers (such as the scanner pulses) from the serial
+    port, in a QThread.
+
+    The read blocks until at least one byte arrives or until the timeout of
+    the port, so the thread does not use the CPU while waiting. All the bytes
+    that are already in the buffer are read at once and each of them is sent
+    to the main thread with the time when it was read (perf_counter_ns).
+
+    Parameters
+    ----------
+    port_input : Serial or None
+        serial port, opened with a timeout (so that the worker can check if
+        it should stop). If None, the worker waits until it's stopped.
+    """
+    signal_to_main = pyqtSignal(int, 'qint64')
+
+    def __init__(self, port_input):
+        super().__init__()
+        self.port_input = port_input
+        self.stopped = Event()
+
+    @pyqtSlot()
+    def start_reading(self):
+        if self.port_input is None:
+            self.stopped.wait()
+            return
+
+        while not self.stopped.is_set():
+            serial_input = self.port_input.read(max(1, self.port_input.in_waiting))
+            t_read = perf_counter_ns()
+            for number in serial_input:
+                if number != 0:
+                    self.signal_to_main.emit(number, t_read)
+
+    def stop(self):
+        """The worker stops after the current read (at most, the timeout of
+        the port)"""
+        self.stopped.set()
@@ -0,0 +1,48 @@
+"""Per-tick cost of finding the current stimulus, against the length of the
+timing TSV. Run it directly:
+
+    python tests/bench_check_time.py
+"""
+from timeit import default_timer
+
+from numpy import arange, where
+
+from qttasks.schedule import OnsetCursor
+
+QTIMER_INTERVAL = 1  # ms
+SOA = 0.85  # s, like in pulse
+N_ROWS = (10, 100, 700, 2000, 10000)
+N_TICKS = 20000
+
+
+def tick_where(onsets, ticks):
+    for elapsed in ticks:
+        where((onsets * 1e3) <= elapsed)[0]
+
+
+def tick_cursor(onsets, ticks):
+    cursor = OnsetCursor(onsets)
+    for elapsed in ticks:
+        cursor.advance(elapsed)
+
+
+def bench(func, onsets, ticks):
+    t0 = default_timer()
+    func(onsets, ticks)
+    return (default_timer() - t0) / len(ticks) * 1e9
+
+
+def main():
+    print(f'{"rows":>8}{"where (ns/tick)":>20}{"cursor (ns/tick)":>20}')
+    for n_rows in N_ROWS:
+        onsets = arange(n_rows) * SOA
+        # spread the ticks over the whole schedule
+        step = max(QTIMER_INTERVAL, onsets[-1] * 1e3 / N_TICKS)
+        ticks = arange(N_TICKS) * step
+        print(f'{n_rows:>8}'
+              f'{bench(tick_where, onsets, ticks):>20.0f}'
+              f'{bench(tick_cursor, onsets, ticks):>20.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Sustained sample rate of the dataglove acquisition, with the stand-in for
+fglove.dll (fglove_stub.c, built with gcc), in each capture mode and at
+increasing packet rates. Run it directly:
+
+    python tests/bench_dataglove.py [results.json]
+"""
+from json import dump
+from os import environ
+from pathlib import Path
+from subprocess import run
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import sleep
+
+from numpy import diff, percentile
+
+from qttasks.dataglove import CAPTURE_MODES, FiveDTGlove, GloveRecorder, read_glove
+
+STUB_C = Path(__file__).resolve().parent / 'fglove_stub.c'
+PACKET_RATES = (75, 500, 2000, 5000)  # Hz
+DURATION = 3  # s
+PERCENTILES = (50, 95, 99, 100)
+
+
+def record(tmpdir, mode, packet_rate):
+    environ['FGLOVE_STUB_RATE'] = str(packet_rate)
+    glove = FiveDTGlove()
+    glove.open(b'USB0')
+    glove_file = tmpdir / f'{mode}_{packet_rate}.bin'
+    recorder = GloveRecorder(glove, glove_file, mode=mode)
+    recorder.start()
+    sleep(DURATION)
+    recorder.stop()
+    recorder.join()
+    glove.close()
+
+    samples = read_glove(glove_file)
+    t = samples['time']
+    packets = samples['sensors'][:, 0].astype(int)
+    n_lost = int(((diff(packets) % 2 ** 16) - 1).sum())
+    interval = diff(t) / 1e3
+    return {
+        'n_samples': int(samples.shape[0]),
+        'sample_rate': float((samples.shape[0] - 1) / (t[-1] - t[0]) * 1e9),
+        'lost_packets': n_lost,
+        'interval_us': {str(p): float(v) for p, v in zip(PERCENTILES, percentile(interval, PERCENTILES))},
+        }
+
+
+def main():
+    results_json = Path(argv[1] if len(argv) > 1 else 'bench_dataglove.json')
+
+    results = {}
+    with TemporaryDirectory() as tmpdir:
+        tmpdir = Path(tmpdir)
+        dll_file = tmpdir / 'fglove_stub.so'
+        run(['gcc', '-shared', '-fPIC', '-O2', '-o', str(dll_file), str(STUB_C), '-lpthread'], check=True)
+        FiveDTGlove.load_library(dll_file)
+
+        for mode in CAPTURE_MODES:
+            for packet_rate in PACKET_RATES:
+                results[f'{mode} {packet_rate} Hz'] = record(tmpdir, mode, packet_rate)
+
+    with results_json.open('w') as f:
+        dump(results, f, indent=2)
+    print(f'Results saved to {results_json}')
+    for k, v in results.items():
+        print(f'{k}: {v["sample_rate"]:.0f} Hz, {v["lost_packets"]} lost packets')
+
+
+if __name__ == '__main__':
+    main()
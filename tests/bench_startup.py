@@ -0,0 +1,75 @@
+"""Startup time of qttasks, in a new process each time: import of
+qttasks.presentation, merge of the parameters (compiled or not) and creation
+of the widget, until it's ready to show READY. The serial ports are loop://
+and the sound is off. Run it directly:
+
+    QT_QPA_PLATFORM=offscreen python tests/bench_startup.py [task] [results.json]
+"""
+from json import dump, loads
+from os import environ
+from pathlib import Path
+from subprocess import run
+from sys import argv, executable
+
+from numpy import median
+
+N_RUNS = 7
+
+SCRIPT = """
+from json import dumps
+from os import _exit
+from time import perf_counter_ns
+from qttasks import T_LAUNCH
+from qttasks import presentation
+from qttasks.paths import TASKS_DIR, read_parameters
+t_import = perf_counter_ns()
+
+P = read_parameters('{task}')
+t_parameters = perf_counter_ns()
+
+P['COM']['TRIGGER']['PORT'] = 'loop://'
+P['COM']['INPUT']['PORT'] = 'loop://'
+P['SOUND']['PLAY'] = False
+P['FULLSCREEN'] = False
+P['DATAGLOVE'] = False
+P['TASK_TSV'] = TASKS_DIR / '{task}' / P['TASK_TSV']
+w = presentation.PrettyWidget(P)
+presentation.app.processEvents()
+t_ready = perf_counter_ns()
+print(dumps({{
+    'import_ms': (t_import - T_LAUNCH) / 1e6,
+    'parameters_ms': (t_parameters - t_import) / 1e6,
+    'widget_ms': (t_ready - t_parameters) / 1e6,
+    'ready_ms': (t_ready - T_LAUNCH) / 1e6,
+    }}), flush=True)
+_exit(0)  # without stopping the threads of the widget
+"""
+
+
+def startup(task):
+    env = dict(environ, QT_QPA_PLATFORM=environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    p = run([executable, '-c', SCRIPT.format(task=task)], capture_output=True, text=True, env=env, check=True)
+    return loads(p.stdout.splitlines()[-1])
+
+
+def main():
+    task = argv[1] if len(argv) > 1 else 'fast'
+    results_json = Path(argv[2] if len(argv) > 2 else 'bench_startup.json')
+
+    runs = [startup(task) for _ in range(N_RUNS)]
+    results = {
+        'task': task,
+        'n_runs': N_RUNS,
+        }
+    for k in runs[0]:
+        results[k] = float(median([x[k] for x in runs]))
+
+    with results_json.open('w') as f:
+        dump(results, f, indent=2)
+    print(f'Results saved to {results_json}')
+    for k, v in results.items():
+        print(f'{k}: {v}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Timing of the triggers, with loop:// ports instead of the serial ports. The
+task is started by writing START_TRIGGER to the input port, like the scanner
+does, and the time when each trigger is written to the trigger port is
+compared with the onset of the stimulus. The frames are painted into an
+image (ImageWidget), so it runs without OpenGL. Run it directly:
+
+    QT_QPA_PLATFORM=offscreen python tests/bench_triggers.py [results.json]
+"""
+from json import dump, load
+from os import environ
+from pathlib import Path
+from sys import argv
+from tempfile import TemporaryDirectory
+from time import perf_counter_ns
+
+environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from numpy import array, percentile  # noqa: E402
+from PyQt5.QtCore import QTimer  # noqa: E402
+
+from qttasks import presentation  # noqa: E402
+from qttasks.paths import DEFAULTS_JSON  # noqa: E402
+from image_widget import ImageWidget  # noqa: E402
+
+N_STIMULI = 100
+SOA = 0.05  # s
+FIRST_ONSET = 0.5  # s
+START_AFTER = 1000  # ms
+PERCENTILES = (0, 5, 50, 95, 100)
+
+
+def read_parameters(task_tsv):
+    with DEFAULTS_JSON.open() as f:
+        P = load(f)
+
+    with task_tsv.open('w') as f:
+        f.write('onset\tduration\ttrial_type\ttrial_name\tstim_file\n')
+        for i in range(N_STIMULI):
+            # each stimulus has its own trigger, between 1 and 200
+            f.write(f'{FIRST_ONSET + i * SOA:.3f}\t{SOA}\t{i % 200 + 1}\tstimulus{i}\ttext{i}\n')
+
+    P['TASK_TSV'] = task_tsv
+    P['SCHEDULE_CACHE'] = False
+    P['COM']['TRIGGER']['PORT'] = 'loop://'
+    P['COM']['INPUT']['PORT'] = 'loop://'
+    P['SOUND']['PLAY'] = False
+    P['FULLSCREEN'] = False
+    P['OUTRO'] = 0.5
+    return P
+
+
+def run(P):
+    w = ImageWidget(P)
+    t_input = []
+
+    def send_start_trigger():
+        t_input.append(perf_counter_ns())
+        w.port_input.write(bytes((P['COM']['INPUT']['START_TRIGGER'], )))
+
+    QTimer.singleShot(START_AFTER, send_start_trigger)
+    timeout = START_AFTER + (FIRST_ONSET + N_STIMULI * SOA + P['OUTRO'] + 5) * 1e3
+    QTimer.singleShot(int(timeout), w.stop)  # if the stimuli are not presented
+    presentation.app.exec()
+    w.trigger_writer.join()
+
+    return w, t_input[0]
+
+
+def summarize(w, t_input):
+    timestamps = array(w.trigger_writer.timestamps, dtype='int64').reshape(-1, 3)
+    results = {
+        'parameters': {
+            'n_stimuli': N_STIMULI,
+            'soa': SOA,
+            'scheduler': w.P['SCHEDULER'],
+            'renderer': w.P['RENDERER'],
+            },
+        'input_to_start_ms': (w.t_start - t_input) / 1e6,
+        'trigger_latency_us': _percentiles(w.trigger_writer.latency / 1e3),
+        }
+
+    # triggers of the stimuli, in the order in which they were sent
+    i_start = list(timestamps[:, 0]).index(254)
+    triggers = timestamps[i_start + 1:]
+    triggers = triggers[(triggers[:, 0] >= 1) & (triggers[:, 0] <= 200)]
+    results['n_presented'] = int(triggers.shape[0])
+    if triggers.shape[0] != N_STIMULI:
+        raise RuntimeError(f'Only {triggers.shape[0]} / {N_STIMULI} stimuli were presented')
+
+    trial_types = w.stimuli['trial_type']
+    onsets = w.stimuli['onset'][(trial_types >= 1) & (trial_types <= 200)]
+    expected = w.t_start + (onsets * 1e9).astype('int64')
+    onset_error = (triggers[:, 2] - expected) / 1e6
+    results['onset_error_ms'] = _percentiles(onset_error)
+    results['jitter_ms'] = _percentiles(onset_error - onset_error.mean())
+    return results
+
+
+def _percentiles(values):
+    return {str(p): float(v) for p, v in zip(PERCENTILES, percentile(values, PERCENTILES))}
+
+
+def main():
+    results_json = Path(argv[1] if len(argv) > 1 else 'bench_triggers.json')
+
+    with TemporaryDirectory() as tmpdir:
+        P = read_parameters(Path(tmpdir) / 'timing.tsv')
+        w, t_input = run(P)
+    results = summarize(w, t_input)
+
+    with results_json.open('w') as f:
+        dump(results, f, indent=2)
+    print(f'Results saved to {results_json}')
+    for k, v in results.items():
+        print(f'{k}: {v}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+/*
+Stand-in for fglove.dll, with the functions used by qttasks.dataglove, to
+test and benchmark the acquisition without the glove:
+
+    gcc -shared -fPIC -O2 -o fglove_stub.so tests/fglove_stub.c -lpthread
+
+FGLOVE_STUB_GLOVES gloves (environment variable, default 1) are connected,
+on USB0, USB1, ... and opening a glove takes FGLOVE_STUB_OPEN_MS ms (default
+0). Each glove produces packets at FGLOVE_STUB_RATE Hz (default 75) in its own
+thread. Sensor j of packet n has the raw value n + j
+and the scaled value (n + j) / 4095.
+
+fdStubMaxOpening (not in fglove.dll) returns how many gloves were being
+opened at the same time, at most.
+*/
+#include <pthread.h>
+#include <stdbool.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+#include <unistd.h>
+
+#define NUM_SENSORS 14
+#define GLOVE14U_USB 10
+#define LEFT 0
+#define RIGHT 1
+#define PRODUCT_ID 0x100
+
+typedef void (*callback_t)(void *);
+
+typedef struct {
+    pthread_t thread;
+    pthread_mutex_t lock;
+    volatile bool running;
+    int rate;
+    unsigned long n_packets;
+    unsigned long n_read;
+    int hand;
+    unsigned short packet[NUM_SENSORS];
+    callback_t callback;
+    void *param;
+} fdGlove;
+
+static pthread_mutex_t opening_lock = PTHREAD_MUTEX_INITIALIZER;
+static int n_opening = 0;
+static int max_opening = 0;
+
+static void *produce(void *arg)
+{
+    fdGlove *glove = arg;
+    struct timespec next;
+    long period = 1000000000L / glove->rate;
+    int j;
+
+    clock_gettime(CLOCK_MONOTONIC, &next);
+    while (glove->running) {
+        next.tv_nsec += period;
+        while (next.tv_nsec >= 1000000000L) {
+            next.tv_nsec -= 1000000000L;
+            next.tv_sec++;
+        }
+        clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &next, NULL);
+
+        pthread_mutex_lock(&glove->lock);
+        for (j = 0; j < NUM_SENSORS; j++)
+            glove->packet[j] = (unsigned short)(glove->n_packets + j);
+        glove->n_packets++;
+        if (glove->callback != NULL)
+            glove->callback(glove->param);
+        pthread_mutex_unlock(&glove->lock);
+    }
+    return NULL;
+}
+
+static int getenv_int(const char *name, int default_value)
+{
+    const char *value = getenv(name);
+
+    return value == NULL ? default_value : atoi(value);
+}
+
+fdGlove *fdOpen(char *port)
+{
+    fdGlove *glove;
+    int i_port;
+
+    if (strncmp(port, "USB", 3) != 0)
+        return NULL;
+    i_port = atoi(port + 3);
+    if (i_port >= getenv_int("FGLOVE_STUB_GLOVES", 1))
+        return NULL;
+
+    pthread_mutex_lock(&opening_lock);
+    n_opening++;
+    if (n_opening > max_opening)
+        max_opening = n_opening;
+    pthread_mutex_unlock(&opening_lock);
+    usleep(getenv_int("FGLOVE_STUB_OPEN_MS", 0) * 1000);
+    pthread_mutex_lock(&opening_lock);
+    n_opening--;
+    pthread_mutex_unlock(&opening_lock);
+
+    glove = calloc(1, sizeof(fdGlove));
+    glove->rate = getenv_int("FGLOVE_STUB_RATE", 75);
+    glove->hand = i_port % 2 == 0 ? RIGHT : LEFT;
+    glove->running = true;
+    pthread_mutex_init(&glove->lock, NULL);
+    pthread_create(&glove->thread, NULL, produce, glove);
+    return glove;
+}
+
+int fdStubMaxOpening(void)
+{
+    return max_opening;
+}
+
+int fdClose(fdGlove *glove)
+{
+    glove->running = false;
+    pthread_join(glove->thread, NULL);
+    pthread_mutex_destroy(&glove->lock);
+    free(glove);
+    return 1;
+}
+
+int fdScanUSB(unsigned short *product_ids, int *n_max)
+{
+    int n_gloves = getenv_int("FGLOVE_STUB_GLOVES", 1);
+    int i;
+
+    if (n_gloves > *n_max)
+        n_gloves = *n_max;
+    for (i = 0; i < n_gloves; i++)
+        product_ids[i] = PRODUCT_ID;
+    return n_gloves;
+}
+
+int fdGetGloveHand(fdGlove *glove)
+{
+    return glove->hand;
+}
+
+int fdGetGloveType(fdGlove *glove)
+{
+    (void)glove;
+    return GLOVE14U_USB;
+}
+
+int fdGetNumSensors(fdGlove *glove)
+{
+    (void)glove;
+    return NUM_SENSORS;
+}
+
+int fdGetPacketRate(fdGlove *glove)
+{
+    return glove->rate;
+}
+
+bool fdNewData(fdGlove *glove)
+{
+    return glove->n_packets != glove->n_read;
+}
+
+/* it's called in the callback too, so the lock is not taken here */
+void fdGetSensorRawAll(fdGlove *glove, unsigned short *data)
+{
+    memcpy(data, glove->packet, sizeof(glove->packet));
+    glove->n_read = glove->n_packets;
+}
+
+void fdGetSensorScaledAll(fdGlove *glove, float *data)
+{
+    int j;
+
+    for (j = 0; j < NUM_SENSORS; j++)
+        data[j] = glove->packet[j] / 4095.0f;
+    glove->n_read = glove->n_packets;
+}
+
+bool fdGetAutoCalibrate(fdGlove *glove)
+{
+    (void)glove;
+    return true;
+}
+
+bool fdSetCallback(fdGlove *glove, void *func, void *param)
+{
+    pthread_mutex_lock(&glove->lock);
+    glove->callback = (callback_t)func;
+    glove->param = param;
+    pthread_mutex_unlock(&glove->lock);
+    return true;
+}
+
+/* when it returns, the callback is not running anymore */
+void fdRemoveCallback(fdGlove *glove)
+{
+    pthread_mutex_lock(&glove->lock);
+    glove->callback = NULL;
+    pthread_mutex_unlock(&glove->lock);
+}
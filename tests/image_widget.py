@@ -0,0 +1,38 @@
+"""Widget for the tests and the benchmarks that present the task in real
+time without OpenGL"""
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QImage, QPainter
+
+from qttasks.presentation import PrettyWidget
+
+
+class ImageWidget(PrettyWidget):
+    """Present the task in real time, but paint each frame into an image
+    instead of the OpenGL surface, so that it also runs where OpenGL is not
+    available (such as offscreen, in the tests and in the benchmarks).
+
+    Like paintGL, each frame is painted with paint and followed by presented,
+    then frameSwapped is emitted, as after the buffer swap.
+    """
+    update_pending = False
+
+    def __init__(self, parameters):
+        super().__init__(parameters)
+        self.frame = QImage(self.size(), QImage.Format_RGB32)
+        self.resizeGL(self.width(), self.height())
+
+    def update(self):
+        """Paint at the next iteration of the event loop (the requests in the
+        meantime are merged, like QWidget.update)"""
+        if not self.update_pending:
+            self.update_pending = True
+            QTimer.singleShot(0, self.paint_frame)
+
+    def paint_frame(self):
+        self.update_pending = False
+        qp = QPainter()
+        qp.begin(self.frame)
+        self.paint(qp)
+        qp.end()
+        self.presented()
+        self.frameSwapped.emit()
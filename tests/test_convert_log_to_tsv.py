@@ -0,0 +1,103 @@
+from os import utime
+
+from pandas import DataFrame, read_csv
+
+from qttasks.convert_log_to_tsv import (
+    assign_events_to_tsv,
+    convert_logs,
+    create_tsv,
+    find_logs,
+    import_txt,
+    iter_txt,
+    split_database,
+    write_index,
+    )
+
+LOG = """\
+12:00:00.000\tqttask\tDEBUG\tSending trigger 250
+12:00:01.003\tqttask\tINFO\tPresenting face
+12:00:01.004\tqttask\tDEBUG\tSending trigger 001
+12:00:02.004\tqttask\tINFO\tPresenting BASELINE
+12:00:02.004\tqttask\tDEBUG\tSending trigger 000
+"""
+
+
+def test_create_tsv(capsys):
+    df = DataFrame([
+        (0, 'Sending trigger 250'),
+        (1, 'Presenting face'),
+        (1.001, 'Sending trigger 001'),
+        (2, 'Presenting BASELINE'),
+        (2, 'Sending trigger 000'),
+        (3.002, 'Presenting house'),
+        (3, 'Sending trigger 002'),
+        (4, 'Sending trigger 003'),
+        (4.5, 'Presenting car'),
+        ], columns=['time', 'info'])
+    df_trg, df_events = split_database(df)
+    out = assign_events_to_tsv(create_tsv(df_trg), df_events)
+
+    assert list(out['value']) == ['250', '001', '002', '003']
+    assert list(out['onset']) == [0, 1.001, 3, 4]
+    assert list(out['duration'].round(3)) == [0, 0.999, 0, 0]
+    assert list(out['trial_name']) == ['', 'face', 'house', '']
+    assert 'Could not find matching trigger for 1 events at 4.500' in capsys.readouterr().out
+
+
+def test_assign_events_unsorted():
+    # with the swap times, the trigger of face is before the one of 003
+    out = DataFrame({
+        'onset': [0, 2.005, 1.990, 3],
+        'duration': 0.,
+        'value': ['250', '003', '001', '002'],
+        'trial_name': '',
+        })
+    df_events = DataFrame([
+        (1.990, 'Presenting face'),
+        (2.005, 'Presenting car'),
+        (3.001, 'Presenting house'),
+        ], columns=['time', 'info'])
+    out = assign_events_to_tsv(out, df_events)
+    assert list(out['trial_name']) == ['', 'car', 'face', 'house']
+
+
+def test_convert_logs(tmp_path):
+    for name in ('log_20240101_120000', 'log_20240102_120000'):
+        (tmp_path / (name + '.txt')).write_text(LOG)
+    (tmp_path / 'log_20240103_120000.txt').write_text('not a log\n')
+    (tmp_path / 'dataglove_20240101_120000.txt').write_text('')
+
+    logs = find_logs([tmp_path, ])
+    assert [x.stem for x in logs] == ['log_20240101_120000', 'log_20240102_120000', 'log_20240103_120000']
+    assert find_logs([str(tmp_path / 'log_202401*.txt'), logs[0]]) == logs
+
+    status = convert_logs(logs, workers=2)
+    assert list(status.values())[:2] == ['converted', 'converted']
+    assert status[logs[2]] not in ('converted', 'up to date')
+
+    status = convert_logs(logs[:2])
+    assert list(status.values()) == ['up to date', 'up to date']
+    tsv = logs[0].with_suffix('.tsv')
+    st = tsv.stat()
+    utime(logs[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert convert_logs(logs[:2], workers=1)[logs[0]] == 'converted'
+
+    index_tsv = tmp_path / 'index.tsv'
+    write_index(logs[:2], index_tsv)
+    index = read_csv(index_tsv, sep='\t', dtype={'value': str})
+    assert list(index['session']) == ['log_20240101_120000', ] * 2 + ['log_20240102_120000', ] * 2
+    assert list(index['value']) == ['250', '001'] * 2
+
+
+def test_import_txt(tmp_path):
+    log_txt = tmp_path / 'log.txt'
+    log_txt.write_text(
+        '12:00:00.000\tdataglove\tDEBUG\tSending trigger 1 2 3\n'
+        '12:00:00.500\tqttask\tINFO\tStarting\n'
+        + LOG)
+
+    chunks = list(iter_txt(log_txt, chunk_size=2))
+    assert [len(x[0]) for x in chunks] == [2, 2, 1]
+    df = import_txt(log_txt, chunk_size=2)
+    assert list(df['info']) == [x.split('\t')[3] for x in LOG.splitlines()]
+    assert list((df['time'] - 12 * 3600).round(3)) == [0, 1.003, 1.004, 2.004, 2.004]
@@ -0,0 +1,195 @@
+from ctypes import c_ushort
+from io import BytesIO
+from pathlib import Path
+from shutil import which
+from subprocess import run
+from time import monotonic, perf_counter_ns, sleep
+
+from numpy import arange, diff, frombuffer
+from pytest import fixture, mark, raises, skip
+
+from qttasks.dataglove import (
+    BLOCK_SIZE,
+    CAPTURE_MODES,
+    N_BLOCKS,
+    FiveDTGlove,
+    GloveRecorder,
+    attach_glove,
+    discover_gloves,
+    read_glove,
+    )
+
+STUB_C = Path(__file__).resolve().parent / 'fglove_stub.c'
+TIMEOUT = 10  # s, so that a recorder that stalls does not hang the tests
+
+
+def wait_until(condition, timeout=TIMEOUT):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, f'timed out after {timeout} s'
+        sleep(0.01)
+
+
+class FakeGlove:
+    """Same methods as FiveDTGlove, with a new packet at each call of new_data"""
+    num_sensors = 14
+
+    def __init__(self, n_packets):
+        self.raw = (c_ushort * self.num_sensors)()
+        self.raw_array = frombuffer(self.raw, dtype='<u2')
+        self.n_packets = n_packets
+        self.i = 0
+
+    def get_packet_rate(self):
+        return 5000
+
+    def get_glove_hand(self):
+        return 'Right'
+
+    def get_glove_type(self):
+        return 'GLOVE14U_USB'
+
+    def new_data(self):
+        return self.i < self.n_packets
+
+    def read_raw(self):
+        for j in range(self.num_sensors):
+            self.raw[j] = self.i + j
+        self.i += 1
+
+
+def test_glove_recorder(tmp_path):
+    n_packets = BLOCK_SIZE * 2 + 10
+    glove_file = tmp_path / 'log_dataglove0.bin'
+    recorder = GloveRecorder(FakeGlove(n_packets), glove_file)
+    recorder.start()
+    wait_until(lambda: recorder.n_samples >= n_packets)
+    assert list(recorder.latest['sensors'][:2]) == [n_packets - 1, n_packets]
+    recorder.stop()
+    recorder.join()
+
+    samples = read_glove(glove_file)
+    assert samples.shape[0] == n_packets
+    assert (samples['sensors'][:, 0] == arange(n_packets)).all()
+    assert (samples['sensors'][:, -1] == arange(n_packets) + 13).all()
+    assert (diff(samples['time']) > 0).all()
+
+
+def test_glove_recorder_flush(tmp_path, caplog):
+    n_ring = N_BLOCKS * BLOCK_SIZE
+    recorder = GloveRecorder(FakeGlove(n_ring * 2), tmp_path / 'log_dataglove0.bin')
+    recorder.f = BytesIO()
+    for _ in range(BLOCK_SIZE + 10):
+        recorder.record()
+    assert recorder.f.tell() == 0  # the callback never writes to file
+    recorder.flush()
+    assert recorder.n_written == BLOCK_SIZE
+
+    # the thread did not flush for longer than the ring buffer
+    for _ in range(n_ring):
+        recorder.record()
+    recorder.flush(final=True)
+    assert 'overwritten' in caplog.text
+    assert recorder.n_written == recorder.n_samples
+    samples = frombuffer(recorder.f.getvalue(), dtype=recorder.ring.dtype)
+    assert list(samples['sensors'][:BLOCK_SIZE, 0]) == list(range(BLOCK_SIZE))
+    assert (diff(samples['sensors'][BLOCK_SIZE:, 0].astype(int)) == 1).all()
+    assert samples['sensors'][-1, 0] == recorder.n_samples - 1
+    recorder._release()
+
+
+@fixture
+def stub_dll(tmp_path, monkeypatch):
+    """Build the stand-in for fglove.dll and use it for all the gloves"""
+    if which('gcc') is None:
+        skip('gcc is needed to build the stand-in for fglove.dll')
+    dll_file = tmp_path / 'fglove_stub.so'
+    run(['gcc', '-shared', '-fPIC', '-O2', '-o', str(dll_file), str(STUB_C), '-lpthread'], check=True)
+    monkeypatch.setenv('FGLOVE_STUB_RATE', '2000')
+    monkeypatch.setattr(FiveDTGlove, 'gloveDLL', None)
+    assert FiveDTGlove.load_library(dll_file)
+    return dll_file
+
+
+@mark.parametrize('mode', CAPTURE_MODES)
+def test_glove_recorder_stub(tmp_path, stub_dll, mode):
+    glove = FiveDTGlove()
+    glove.open(b'USB0')
+    assert glove.get_glove_hand() == 'Right'
+    assert glove.num_sensors == 14
+
+    glove_file = tmp_path / 'log_dataglove0.bin'
+    recorder = GloveRecorder(glove, glove_file, t_zero=perf_counter_ns(), mode=mode)
+    recorder.start()
+    wait_until(lambda: recorder.n_samples >= BLOCK_SIZE + 10)
+
+    shm, count, ring = attach_glove(recorder.shm_name, glove.num_sensors)
+    n = int(count[0])
+    assert n >= BLOCK_SIZE + 10
+    assert ring['sensors'][n - 1, 1] == ring['sensors'][n - 1, 0] + 1
+    del count, ring
+    shm.close()
+
+    recorder.stop()
+    recorder.join()
+    glove.close()
+    assert recorder.shm_name is None
+
+    samples = read_glove(glove_file)
+    assert samples.shape[0] == recorder.n_samples
+    assert (diff(samples['time']) > 0).all()
+    if mode == 'callback':  # each packet exactly once
+        assert (diff(samples['sensors'][:, 0].astype(int)) == 1).all()
+
+
+def test_glove_sensors(tmp_path, stub_dll):
+    glove = FiveDTGlove()
+    glove.open(b'USB0')
+    with raises(ValueError):
+        GloveRecorder(glove, tmp_path / 'log_dataglove0.bin', sensors=[0, 14])
+
+    wait_until(glove.new_data)  # first packet
+    raw = glove.get_sensor_raw_all([0, 3, 13])
+    assert list(raw - raw[0]) == [0, 3, 13]
+    scaled = glove.get_sensor_scaled_all()
+    assert scaled.shape == (14, )
+    assert abs(scaled[1] - scaled[0] - 1 / 4095) < 1e-6
+
+    glove_file = tmp_path / 'log_dataglove0.bin'
+    recorder = GloveRecorder(glove, glove_file, mode='callback', sensors=[1, 4], scaled=True)
+    recorder.start()
+    wait_until(lambda: recorder.n_samples >= 10)
+    recorder.stop()
+    recorder.join()
+    glove.close()
+
+    samples = read_glove(glove_file)
+    assert samples['sensors'].dtype == 'float32'
+    assert samples['sensors'].shape == (recorder.n_samples, 2)
+    assert abs(samples['sensors'][:, 1] - samples['sensors'][:, 0] - 3 / 4095).max() < 1e-6
+
+
+def test_discover_gloves(tmp_path, stub_dll, monkeypatch):
+    monkeypatch.setenv('FGLOVE_STUB_GLOVES', '2')
+    monkeypatch.setenv('FGLOVE_STUB_OPEN_MS', '300')
+    assert FiveDTGlove.scan_USB() == 2
+
+    gloves = discover_gloves()
+    assert FiveDTGlove.gloveDLL.fdStubMaxOpening() == 2  # opened in parallel
+    assert [x.port for x in gloves] == ['USB0', 'USB1']
+    assert [x.get_glove_hand() for x in gloves] == ['Right', 'Left']
+
+    recorders = [
+        GloveRecorder(glove, tmp_path / f'log_dataglove{i}.bin', mode='callback')
+        for i, glove in enumerate(gloves)]
+    for recorder in recorders:
+        recorder.start()
+    wait_until(lambda: min(x.n_samples for x in recorders) >= 20)
+    for recorder in recorders:
+        recorder.stop()
+        recorder.join()
+        recorder.glove.close()
+
+    t = [read_glove(tmp_path / f'log_dataglove{i}.bin')['time'] for i in range(2)]
+    # same clock, so the two streams overlap
+    assert max(t[0][0], t[1][0]) < min(t[0][-1], t[1][-1])
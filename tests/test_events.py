@@ -0,0 +1,82 @@
+from json import load
+from pathlib import Path
+
+from numpy import array, fromfile
+
+from qttasks.convert_log_to_tsv import convert_log_to_tsv
+from qttasks.events import EVENT, EVENT_DTYPE, EVENTS, EventLog
+from qttasks.fast import FastSequence
+
+TASK_DIR = Path('/task')
+
+
+def _stimuli():
+    fast = FastSequence(array(
+        [(0, 2, 'a'), (2, 0, None)],
+        dtype=[('onset', '<i8'), ('duration', '<i8'), ('stim_file', 'O')]))
+    return array(
+        [
+            ('BASELINE', '+', 0),
+            ('face', TASK_DIR / 'images' / 'face.png', 1),
+            ('BASELINE', '+', 0),
+            ('fast', fast, 2),
+            ('house', Path('/other/house.png'), 3),
+            ('face', TASK_DIR / 'images' / 'face.png', 1),
+            ],
+        dtype=[('trial_name', 'O'), ('stim_file', 'O'), ('trial_type', 'i8')])
+
+
+def test_event_log_header(tmp_path):
+    stimuli = _stimuli()
+    events_file = tmp_path / 'log_events.bin'
+    events = EventLog(events_file, stimuli, TASK_DIR)
+    events.close()
+
+    with events_file.with_suffix('.json').open() as f:
+        header = load(f)
+    assert header['format'] == EVENT.format
+    assert header['events'] == EVENTS
+    assert header['trial_name'] == ['BASELINE', 'face', 'BASELINE', 'fast', 'house', 'face']
+    # each stimulus only once, relative to the task folder if possible
+    assert header['stimuli'] == ['+', '/other/house.png', 'FAST', 'images/face.png']
+    assert events.stim_ids == [0, 3, 0, 2, 1, 3]
+
+
+def test_event_log_without_file():
+    events = EventLog(None, _stimuli(), TASK_DIR)
+    events.write('start')
+    events.close()
+
+
+def test_event_log(tmp_path):
+    stimuli = _stimuli()
+    events_file = tmp_path / 'log_events.bin'
+    events = EventLog(events_file, stimuli, TASK_DIR)
+    t0 = 10 ** 12
+    events.write('trigger', 250, t=t0)
+    events.write('input', 49, t=t0 + 400_000_000)
+    events.write('start', t=t0 + 400_050_000)
+    for i, t in enumerate((0.5, 1.25, 2.0000005)):
+        events.write('present', stimuli['trial_type'][i], i, t=t0 + int(t * 1e9))
+        events.write('trigger', stimuli['trial_type'][i], t=t0 + int(t * 1e9) + 20_000)
+    events.write('pause', t=t0 + 2_500_000_000)
+    events.write('resume', t=t0 + 3_000_000_000)
+    events.write('stop', t=t0 + 3_500_000_000)
+    events.close()
+
+    assert events_file.stat().st_size == 12 * EVENT.size
+    written = fromfile(events_file, EVENT_DTYPE)
+    assert list(written['event'][:3]) == [EVENTS['trigger'], EVENTS['input'], EVENTS['start']]
+    assert written['trigger'][1] == 49
+    assert list(written['trial'][[0, 1, 2, 4]]) == [-1, -1, -1, -1]
+    assert list(written['stim'][3:9:2]) == [0, 3, 0]
+
+    # the converter reads only the events (the .txt log is not needed), it
+    # ignores the input, start, pause, resume and stop events and it keeps
+    # the precision of the time (below 1 ms)
+    log_txt = tmp_path / 'log.txt'
+    tsv = convert_log_to_tsv(log_txt)
+    assert list(tsv['value']) == ['250', '001']
+    assert list(tsv['trial_name']) == ['', 'face']
+    assert list(tsv['onset'].round(7)) == [0, 1.25002]
+    assert list(tsv['duration'].round(7)) == [0.50002, 0.7500005]
@@ -0,0 +1,30 @@
+from numpy import array
+
+from qttasks.fast import FastSequence
+
+FRAME = 10 ** 9 / 50  # ns, at 50 Hz
+
+
+def test_fast_sequence():
+    tsv = array(
+        [(0, 2, 'a'), (2, 1, 'b'), (3, 2, 'a'), (5, 0, None)],
+        dtype=[('onset', '<i8'), ('duration', '<i8'), ('stim_file', 'O')])
+    fast = FastSequence(tsv)
+    assert fast.frames == ['a', 'a', 'b', 'a', 'a']
+    assert fast.images == {'a', 'b'}
+
+    fast.start(50)
+    t0 = 123456789
+    assert fast.current == 'a'
+    fast.swapped(t0)
+    fast.swapped(t0 + FRAME)
+    assert fast.current == 'b'
+
+    # frame #2 was shown two frames late: skip frames #3 and #4
+    fast.swapped(t0 + 4 * FRAME)
+    assert fast.n_dropped == 2
+    assert fast.finished
+
+    fast.start(50)
+    assert fast.current == 'a'
+    assert not fast.finished
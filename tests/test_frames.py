@@ -0,0 +1,55 @@
+from numpy import load
+
+from qttasks.convert_log_to_tsv import convert_log_to_tsv
+from qttasks.frames import FrameTimer
+
+PERIOD = 16_666_667  # ns
+
+LOG = """\
+12:00:00.000\tqttask\tDEBUG\tSending trigger 250
+12:00:01.003\tqttask\tINFO\tPresenting BASELINE
+12:00:01.003\tqttask\tDEBUG\tSending trigger 000
+12:00:02.004\tqttask\tINFO\tPresenting face
+12:00:02.004\tqttask\tDEBUG\tSending trigger 001
+12:00:03.002\tqttask\tINFO\tPresenting BASELINE
+12:00:03.002\tqttask\tDEBUG\tSending trigger 000
+"""
+
+
+def test_frame_timer(tmp_path):
+    frames_file = tmp_path / 'log_frames.npz'
+    timer = FrameTimer(frames_file)
+    timer.frame_period = PERIOD
+
+    i_frames = [0, 1, 2, 5, 6]  # 2 missed vsyncs
+    for i in i_frames:
+        timer.swapped(i * PERIOD, trial=i, continuous=True)
+    timer.swapped(100 * PERIOD)  # not continuous, so it's not late
+    timer.close()
+
+    assert timer.n_outliers == 1
+    assert timer.n_missed == 2
+    assert timer.t_last == 100 * PERIOD
+
+    with load(frames_file) as frames:
+        assert list(frames['trial']) == i_frames + [-1, ]
+        assert frames['t_swap'][3] == 5 * PERIOD
+
+
+def test_convert_with_swap_times(tmp_path):
+    log_txt = tmp_path / 'log.txt'
+    log_txt.write_text(LOG)
+    t_zero = 10 ** 12
+    timer = FrameTimer(tmp_path / 'log_frames.npz')
+    timer.t_zero = t_zero
+    for i, t in enumerate((1.0161, 2.0172, 3.0153)):
+        timer.swapped(t_zero + int(t * 1e9), trial=i)
+        timer.swapped(t_zero + int(t * 1e9) + PERIOD)
+    timer.close()
+
+    tsv = convert_log_to_tsv(log_txt)
+    # trigger 000 (baseline) sets the duration of the previous trigger
+    assert list(tsv['value']) == ['250', '001']
+    assert list(tsv['trial_name']) == ['', 'face']
+    assert list(tsv['onset'].round(4)) == [0, 2.0172]
+    assert list(tsv['duration'].round(4)) == [1.0161, 0.9981]
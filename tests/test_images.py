@@ -0,0 +1,81 @@
+from PyQt5.QtCore import QSize
+
+from qttasks.images import PixmapCache
+from qttasks.paths import TASKS_DIR
+
+IMAGES_DIR = TASKS_DIR / 'fast' / 'fast' / 'images'
+BLUE = IMAGES_DIR / 'blue.png'
+YELLOW = IMAGES_DIR / 'yellow.png'
+RED = TASKS_DIR / 'circle' / 'images' / 'red_circle.png'
+
+
+def test_pixmap_cache(qtbot):
+    images = PixmapCache(memory=10)
+
+    images.prefetch([BLUE, YELLOW])
+    qtbot.waitUntil(lambda: images.collect() == 0)
+    assert images.is_resident([BLUE, YELLOW])
+    assert images[BLUE].width() == 499
+
+    images.budget = images.nbytes - 1
+    images.evict()
+    assert BLUE in images  # it was used more recently
+    assert YELLOW not in images
+    assert not images[YELLOW].isNull()
+    assert BLUE not in images
+
+    images.pin([YELLOW])
+    images.prefetch([BLUE])
+    qtbot.waitUntil(lambda: images.collect() == 0)
+    assert YELLOW in images  # pinned
+
+
+def test_pixmap_cache_scaled(qtbot):
+    images = PixmapCache()
+    images.prefetch([BLUE])
+    qtbot.waitUntil(lambda: images.collect() == 0)
+
+    images.set_size(QSize(1000, 500))
+    assert images.scaled(BLUE).height() == 500
+    assert images.scaled(YELLOW).height() == 500  # decoded when needed
+    # only the scaled images are kept
+    assert images.nbytes == sum(x.width() * x.height() * x.depth() // 8 for x in images.pixmaps.values())
+
+    # scaled again in the background, the old one is kept until then
+    images.set_size(QSize(100, 100))
+    assert images.pixmaps[YELLOW].height() == 500
+    qtbot.waitUntil(lambda: images.collect() == 0)
+    assert images.pixmaps[YELLOW].width() == 100
+    assert images.scaled(BLUE).width() == 100
+
+
+def test_pixmap_cache_current(qtbot):
+    images = PixmapCache(memory=0)
+
+    # the image on the screen is not dropped, even if it's not the most recent
+    images[BLUE]
+    images.prefetch([BLUE, YELLOW])
+    qtbot.waitUntil(lambda: images.collect() == 0)
+    assert BLUE in images
+    assert YELLOW in images
+
+
+def test_pixmap_cache_small_budget(qtbot, caplog):
+    images = PixmapCache(memory=0)
+
+    # the first images are pinned, so they are all in memory before the start
+    images.pin([BLUE, YELLOW])
+    qtbot.waitUntil(lambda: images.collect() == 0)
+    assert images.is_resident([BLUE, YELLOW])
+    assert 'more than CACHE MEMORY' in caplog.text
+
+    # they stay in memory while other images are used
+    images[BLUE]
+    images.prefetch([RED])
+    qtbot.waitUntil(lambda: images.collect() == 0)
+    assert images.is_resident([BLUE, YELLOW])
+
+    # until they are unpinned, one at the time after they are presented
+    images.unpin([YELLOW])
+    assert YELLOW not in images
+    assert BLUE in images  # on the screen
@@ -0,0 +1,36 @@
+from logging import Handler, getLogger
+from re import match
+
+from qttasks.logs import start_logging, stop_logging
+
+lg = getLogger('qttask')
+
+
+class RecordCollector(Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_logging(tmp_path):
+    logname = tmp_path / 'log.txt'
+    listener = start_logging(logname)
+    collector = RecordCollector()
+    listener.handlers += (collector, )
+
+    lg.info('Presenting %s', 'face')
+    lg.debug('Sending trigger 001')
+    stop_logging(listener)
+
+    lines = logname.read_text().splitlines()
+    assert len(lines) == 2
+    # same regex as convert_log_to_tsv
+    g = match(r"(\d{2}:\d{2}:\d{2}.\d{3})\tqttask\t\w*\t(.*)", lines[1])
+    assert g.group(2) == 'Sending trigger 001'
+
+    assert lines[0].endswith('\tPresenting face')
+    # formatted in the thread of the listener, not by the logger
+    assert collector.records[0].args == ('face', )
@@ -0,0 +1,40 @@
+from json import dump
+
+from qttasks import paths
+from qttasks.paths import read_parameters
+
+
+def test_read_parameters(tmp_path, monkeypatch):
+    defaults_json = tmp_path / 'default.json'
+    task_dir = tmp_path / 'tasks' / 'task'
+    task_dir.mkdir(parents=True)
+    config_dir = tmp_path / 'configurations'
+    config_dir.mkdir()
+    monkeypatch.setattr(paths, 'DEFAULTS_JSON', defaults_json)
+    monkeypatch.setattr(paths, 'TASKS_DIR', tmp_path / 'tasks')
+    monkeypatch.setattr(paths, 'CONFIG_DIR', config_dir)
+
+    with defaults_json.open('w') as f:
+        dump({'COM': {'PORT': 'COM1', 'BAUDRATE': 9600}, 'OUTRO': 4}, f)
+    with (task_dir / 'parameters.json').open('w') as f:
+        dump({'OUTRO': 6}, f)
+    with (config_dir / 'or.json').open('w') as f:
+        dump({'COM': {'PORT': 'COM5'}}, f)
+
+    P = read_parameters('task', 'or')
+    assert P == {'COM': {'PORT': 'COM5', 'BAUDRATE': 9600}, 'OUTRO': 6}
+    assert (task_dir / 'compiled' / 'parameters_or.json').exists()
+    assert read_parameters('task', 'or') == P
+    assert read_parameters('task')['COM']['PORT'] == 'COM1'
+    assert (task_dir / 'compiled' / 'parameters.json').exists()
+
+    # the cache is not used when one of the files changes
+    with (task_dir / 'parameters.json').open('w') as f:
+        dump({'OUTRO': 10}, f)
+    assert read_parameters('task', 'or')['OUTRO'] == 10
+
+    # a cache that was only partly written is compiled again
+    compiled_json = task_dir / 'compiled' / 'parameters_or.json'
+    compiled_json.write_text(compiled_json.read_text()[:20])
+    assert read_parameters('task', 'or')['OUTRO'] == 10
+    assert sorted(x.name for x in compiled_json.parent.iterdir()) == ['parameters.json', 'parameters_or.json']
@@ -1,76 +1,98 @@
-from PyQt5.QtTest import QTest
-from PyQt5.QtCore import Qt
-from qttasks.prf import PrettyWidget
-from time import sleep
-from serial import serial_for_url, SerialException
-from pathlib import Path
-from struct import unpack
-
-import threading
+from json import load
 
+from pytest import fixture, importorskip
 
-class SerialThreading(object):
-    def __init__(self):
-        self.triggers_log = Path('triggers.log').resolve()
+from PyQt5.QtCore import Qt
 
-        self.port_trigger = serial_for_url('loop://', timeout=0.1)
-        thread = threading.Thread(target=self.run, args=())
-        thread.daemon = True
-        thread.start()
+from qttasks.paths import DEFAULTS_JSON, TASKS_DIR
 
-    def run(self):
+presentation = importorskip('qttasks.presentation')
+from image_widget import ImageWidget  # noqa: E402
 
-        with self.triggers_log.open('wb') as f:
-            while True:
-                out = self.port_trigger.read()
-                if out != b'':
-                    f.write(out)
+N_STIMULI = 5
+SOA = 0.1
 
 
-def notest_prf_exit(qtbot):
+@fixture(autouse=True)
+def no_exit(monkeypatch):
+    """PrettyWidget.stop exits the application, which would stop the events
+    of the next tests"""
+    monkeypatch.setattr(presentation.start_app(), 'exit', lambda code: None)
 
-    tr = SerialThreading()
 
-    w = PrettyWidget(port_trigger=tr.port_trigger)
-    qtbot.addWidget(w)
-    sleep(1)
+def read_parameters(tmp_path):
+    with DEFAULTS_JSON.open() as f:
+        P = load(f)
 
-    qtbot.keyEvent(
-        QTest.Click,
-        w,
-        Qt.Key_Escape,
-        )
+    task_tsv = tmp_path / 'timing.tsv'
+    with task_tsv.open('w') as f:
+        f.write('onset\tduration\ttrial_type\ttrial_name\tstim_file\n')
+        for i in range(N_STIMULI):
+            f.write(f'{0.5 + i * SOA:.3f}\t{SOA}\t{i + 1}\tstimulus{i}\ttext{i}\n')
 
-    with tr.triggers_log.open('rb') as f:
-        val = f.read()
-    assert unpack('<' + len(val) * 'B', val) == (250, 251)
+    P['TASK_TSV'] = task_tsv
+    P['SCHEDULE_CACHE'] = False
+    P['COM']['TRIGGER']['PORT'] = 'loop://'
+    P['COM']['INPUT']['PORT'] = 'loop://'
+    P['SOUND']['PLAY'] = False
+    P['FULLSCREEN'] = False
+    P['OUTRO'] = 0.2
+    return P
 
 
-def notest_prf_exit_after_start(qtbot):
+def triggers(w):
+    w.trigger_writer.join(timeout=1)
+    return [x[0] for x in w.trigger_writer.timestamps]
 
-    tr = SerialThreading()
 
-    w = PrettyWidget(port_trigger=tr.port_trigger)
+def test_prf_exit(qtbot, tmp_path):
+    w = presentation.PrettyWidget(read_parameters(tmp_path))
     qtbot.addWidget(w)
+    qtbot.keyClick(w, Qt.Key_Escape)
 
-    qtbot.keyEvent(
-        QTest.Click,
-        w,
-        Qt.Key_Enter,
-        )
+    assert not w.trigger_writer.is_alive()
+    assert not w.input_thread.isRunning()
+    assert triggers(w) == [250, 255]
 
-    w.start()
 
-    sleep(5)
-    w.check_time()
-    sleep(5)
-    qtbot.keyEvent(
-        QTest.Click,
-        w,
-        Qt.Key_Escape,
-        )
-    sleep(2)
-
-    with tr.triggers_log.open('rb') as f:
-        val = f.read()
-    assert unpack('<' + len(val) * 'B', val) == (250, 251)
+def test_prf_start_from_input(qtbot, tmp_path):
+    # painted into an image, so that the stimuli are presented without OpenGL
+    w = ImageWidget(read_parameters(tmp_path))
+    qtbot.addWidget(w)
+    qtbot.waitUntil(lambda: w.trigger_writer.port is not None)
+
+    w.port_input.write(bytes((w.P['COM']['INPUT']['START_TRIGGER'], )))
+    qtbot.waitUntil(lambda: w.started)
+    qtbot.waitUntil(lambda: w.finished, timeout=5000)
+    w.stop()
+
+    sent = triggers(w)
+    # baseline before and after the stimuli. The port is closed when END is
+    # painted, so trigger 251 is not written
+    assert sent == [250, 254, 0] + list(range(1, N_STIMULI + 1)) + [0]
+    assert w.frame_timer.n_frames > 0
+
+
+def test_prf_first_images(qtbot, tmp_path):
+    images = sorted((TASKS_DIR / 'fast' / 'fast' / 'images').glob('*.png'))
+    P = read_parameters(tmp_path)
+    with P['TASK_TSV'].open('w') as f:
+        f.write('onset\tduration\ttrial_type\ttrial_name\tstim_file\n')
+        for i, img_file in enumerate(images + images):
+            f.write(f'{0.5 + i * SOA:.3f}\t{SOA}\t{i + 1}\tstimulus{i}\t{img_file}\n')
+    P['CACHE']['MEMORY'] = 0
+
+    w = ImageWidget(P)
+    qtbot.addWidget(w)
+    qtbot.waitUntil(lambda: w.trigger_writer.port is not None)
+    qtbot.waitUntil(lambda: w.images.collect() == 0)
+    w.start()
+    assert w.started
+    # larger than the budget, but they stay in memory after the start
+    assert w.images.pinned == set(images)
+    assert w.images.is_resident(images)
+
+    qtbot.waitUntil(lambda: w.finished, timeout=5000)
+    w.stop()
+    # unpinned after they were presented for the last time
+    assert w.images.pinned == set()
@@ -0,0 +1,21 @@
+from qttasks.fast import FastSequence
+from qttasks.paths import TASKS_DIR
+from qttasks.read_tsv import read_stimuli
+
+
+def test_read_stimuli_fast():
+    P = {
+        'TASK_TSV': TASKS_DIR / 'fast' / 'timing.tsv',
+        'BASELINE': '+',
+        'OUTRO': 4,
+        'SCHEDULE_CACHE': False,
+        }
+    tsv = read_stimuli(P)
+
+    assert list(tsv['trial_name']) == ['BASELINE', 'TEST', 'BASELINE', '', '']
+    assert list(tsv['onset']) == [0, 1, 2, 6, 7]
+
+    fast_tsv = tsv['stim_file'][1].tsv
+    assert isinstance(tsv['stim_file'][1], FastSequence)
+    assert fast_tsv['stim_file'][0] == TASKS_DIR / 'fast' / 'fast' / 'images' / 'yellow.png'
+    assert fast_tsv['stim_file'][-1] is None
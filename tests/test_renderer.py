@@ -0,0 +1,48 @@
+import pytest
+from PyQt5.QtGui import (
+    QColor,
+    QFont,
+    QImage,
+    QOffscreenSurface,
+    QOpenGLContext,
+    QOpenGLFramebufferObject,
+    )
+
+from qttasks.renderer import TextureRenderer
+
+WIDTH = 200
+HEIGHT = 100
+
+
+@pytest.fixture
+def context(qtbot):
+    """OpenGL context, it works headless with Mesa / llvmpipe"""
+    context = QOpenGLContext()
+    surface = QOffscreenSurface()
+    surface.create()
+    if not context.create() or not context.makeCurrent(surface):
+        pytest.skip('cannot create an OpenGL context')
+    yield context
+    context.doneCurrent()
+
+
+def test_renderer(context):
+    fbo = QOpenGLFramebufferObject(WIDTH, HEIGHT)
+    fbo.bind()
+
+    renderer = TextureRenderer(context)
+    renderer.gl.glViewport(0, 0, WIDTH, HEIGHT)
+    renderer.resize(WIDTH, HEIGHT, (WIDTH // 2, HEIGHT // 2))
+
+    image = QImage(10, 10, QImage.Format_RGB32)
+    image.fill(QColor('red'))
+    renderer.upload('red', image)
+
+    renderer.begin(QColor('blue'))
+    renderer.draw_image('red')
+    renderer.draw_text('+', QColor('green'), QFont('SansSerif', 10))
+    renderer.end()
+
+    frame = fbo.toImage()
+    assert QColor(frame.pixel(WIDTH // 2, 5)) == QColor('red')  # scaled to fit
+    assert QColor(frame.pixel(5, HEIGHT // 2)) == QColor('blue')
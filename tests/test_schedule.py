@@ -0,0 +1,64 @@
+from json import load
+from os import utime
+from shutil import copy
+
+from numpy import array
+
+from qttasks.paths import TASKS_DIR
+from qttasks.read_tsv import read_schedule
+from qttasks.schedule import OnsetCursor, load_schedule, save_schedule
+
+
+def test_onset_cursor():
+    cursor = OnsetCursor(array([0, 1, 1.5, 3]))
+
+    assert cursor.advance(-1) == -1
+    assert cursor.advance(0) == 0
+    assert cursor.advance(999) == 0
+    assert cursor.advance(1500) == 2
+    assert not cursor.finished
+    assert cursor.advance(1600) == 2
+    assert cursor.next_onset == 3000
+    assert cursor.advance(10000) == 3
+    assert cursor.finished
+    assert cursor.next_onset is None
+
+
+def test_compiled_schedule(tmp_path):
+    task_tsv = tmp_path / 'timing.tsv'
+    copy(TASKS_DIR / 'circle' / 'timing.tsv', task_tsv)
+    P = {
+        'TASK_TSV': task_tsv,
+        'BASELINE': '+',
+        'OUTRO': 4,
+        'SCHEDULE_CACHE': True,
+        }
+
+    tsv = read_schedule(P)
+    schedule_file = tmp_path / 'compiled' / 'timing.npy'
+    assert schedule_file.exists()
+
+    compiled = read_schedule(P)
+    assert (compiled['onset'] == tsv['onset']).all()
+    assert (compiled['stim_file'] == tsv['stim_file']).all()
+
+    with task_tsv.open('a') as f:
+        f.write('1000\t1\t3\tNEW\timages/red_circle.png\n')
+    assert read_schedule(P).shape[0] > compiled.shape[0]
+
+
+def test_compiled_schedule_touched(tmp_path):
+    task_tsv = tmp_path / 'timing.tsv'
+    copy(TASKS_DIR / 'circle' / 'timing.tsv', task_tsv)
+    key = {'BASELINE': '+'}
+    schedule_file = tmp_path / 'compiled' / 'timing.npy'
+    tsv = array([(0., 'a'), (1., 'b')], dtype=[('onset', '<f8'), ('stim_file', 'O')])
+    save_schedule(tsv, schedule_file, task_tsv, key)
+    assert sorted(x.name for x in schedule_file.parent.iterdir()) == ['timing.json', 'timing.npy']
+
+    # same content, but newer: the header is updated, so it's not hashed again
+    stat = task_tsv.stat()
+    utime(task_tsv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert list(load_schedule(schedule_file, task_tsv, key)['stim_file']) == ['a', 'b']
+    with schedule_file.with_suffix('.json').open() as f:
+        assert load(f)['mtime_ns'] == stat.st_mtime_ns + 10 ** 9
@@ -0,0 +1,33 @@
+from json import load
+
+from pytest import fixture, importorskip
+
+from qttasks.paths import DEFAULTS_JSON, TASKS_DIR
+
+presentation = importorskip('qttasks.presentation')
+from qttasks.simulate import simulate  # noqa: E402
+
+
+@fixture(autouse=True)
+def no_exit(monkeypatch):
+    monkeypatch.setattr(presentation.start_app(), 'exit', lambda code: None)
+
+
+def test_simulate_fast(tmp_path):
+    with DEFAULTS_JSON.open() as f:
+        P = load(f)
+    P['TASK_TSV'] = TASKS_DIR / 'fast' / 'timing.tsv'
+    P['SCHEDULE_CACHE'] = False
+    P['FULLSCREEN'] = False
+
+    timeline_tsv = tmp_path / 'timeline.tsv'
+    summary = simulate(P, timeline_tsv)
+
+    assert summary['missing'] == []
+    assert summary['max_onset_error'] == 0
+    assert summary['duration'] == 6
+
+    with timeline_tsv.open() as f:
+        timeline = [line.split('\t') for line in f.read().splitlines()[1:]]
+    triggers = [int(x[2]) for x in timeline if x[1] == 'trigger']
+    assert triggers == [250, 0, 1, 0, 251]
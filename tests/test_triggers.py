@@ -0,0 +1,73 @@
+from threading import Thread
+from time import monotonic, perf_counter_ns, sleep
+
+from PyQt5.QtCore import Qt
+from serial import serial_for_url
+
+from qttasks.triggers import SerialInputWorker, TriggerWriter
+
+
+def test_trigger_writer():
+    port = serial_for_url('loop://', timeout=1)
+    writer = TriggerWriter(lambda: port)
+    writer.start()
+
+    for trigger in (250, 1, 255):
+        writer.write(trigger)
+    assert port.read(3) == bytes((250, 1, 255))
+
+    writer.close()
+    writer.join()
+    assert not writer.is_alive()
+    assert not port.is_open
+    assert [x[0] for x in writer.timestamps] == [250, 1, 255]
+    assert (writer.latency >= 0).all()
+
+
+def test_trigger_writer_reopen():
+    port = serial_for_url('loop://', timeout=1)
+    attempts = []
+
+    def open_port():
+        attempts.append(monotonic())
+        return port if len(attempts) > 1 else None
+
+    writer = TriggerWriter(open_port, retry_interval=0.2)
+    writer.start()
+    for _ in range(100):  # dropped, without trying to open the port again
+        writer.write(1)
+    sleep(0.3)
+    writer.write(2)
+    assert port.read(1) == bytes((2, ))
+    writer.close()
+    writer.join()
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.2
+
+
+def test_serial_input_worker():
+    port = serial_for_url('loop://', timeout=0.05)
+    worker = SerialInputWorker(port)
+    received = []
+    worker.signal_to_main.connect(
+        lambda number, t_read: received.append((number, t_read)),
+        Qt.DirectConnection)
+    thread = Thread(target=worker.start_reading)
+    thread.start()
+
+    port.write(bytes((49, 0, 49, 7)))
+    sleep(0.2)
+    worker.stop()
+    thread.join(timeout=1)
+    assert not thread.is_alive()
+    assert [x[0] for x in received] == [49, 49, 7]
+    assert all(t_read <= perf_counter_ns() for _, t_read in received)
+
+
+def test_serial_input_worker_without_port():
+    worker = SerialInputWorker(None)
+    thread = Thread(target=worker.start_reading)
+    thread.start()
+    worker.stop()
+    thread.join(timeout=1)
+    assert not thread.is_alive()